@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
-import os, sys, json, threading, traceback
+import time
+_T0 = time.perf_counter()  # cold start is measured from here, before Kivy is imported
+import os, sys, re, json, uuid, hashlib, sqlite3, threading, traceback, heapq, itertools, bisect, unicodedata, contextlib, functools, string, collections
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 
 from kivy.clock import Clock, mainthread
 from kivy.core.text import LabelBase
@@ -24,6 +28,9 @@ from kivymd.uix.progressbar import MDProgressBar
 from kivymd.uix.dialog import MDDialog
 
 from kivy.uix.scrollview import ScrollView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.uix.slider import Slider
 from kivy.uix.label import Label
 from kivy.uix.floatlayout import FloatLayout
@@ -51,31 +58,39 @@ try:
 except Exception:
     AR_SUPPORT = False
 
-if os.path.exists(AR_FONT_REGULAR):
-    try:
-        LabelBase.register(name='Roboto', fn_regular=AR_FONT_REGULAR,
-                           fn_bold=AR_FONT_BOLD if os.path.exists(AR_FONT_BOLD) else AR_FONT_REGULAR)
-    except Exception as e:
-        print('Font register error:', e)
-else:
-    if sys.platform.startswith('win'):
+def register_fonts():
+    """Register the Arabic font as Roboto; called from build() rather than at import."""
+    if os.path.exists(AR_FONT_REGULAR):
         try:
-            LabelBase.register(name='Roboto', fn_regular=r'C:\Windows\Fonts\arial.ttf')
-        except Exception:
-            pass
+            LabelBase.register(name='Roboto', fn_regular=AR_FONT_REGULAR,
+                               fn_bold=AR_FONT_BOLD if os.path.exists(AR_FONT_BOLD) else AR_FONT_REGULAR)
+        except Exception as e:
+            print('Font register error:', e)
+    else:
+        if sys.platform.startswith('win'):
+            try:
+                LabelBase.register(name='Roboto', fn_regular=r'C:\Windows\Fonts\arial.ttf')
+            except Exception:
+                pass
 
-def _reshape_arabic(text: str) -> str:
-    if not AR_SUPPORT or not isinstance(text, str):
-        return text
+def _has_arabic(text):
+    return any('\u0600' <= ch <= '\u06FF' or '\u0750' <= ch <= '\u08FF' for ch in text)
+
+@functools.lru_cache(maxsize=4096)
+def _shape(text, base_dir=None):
+    """reshape + bidi for one string, memoized (titles and labels repeat on every rebuild)."""
     try:
-        if any('\u0600' <= ch <= '\u06FF' or '\u0750' <= ch <= '\u08FF' for ch in text):
-            reshaped = arabic_reshaper.reshape(text)
-            bidi_text = get_display(reshaped)
-            return bidi_text
+        if base_dir or _has_arabic(text):
+            return get_display(arabic_reshaper.reshape(text), base_dir=base_dir)
     except Exception:
         pass
     return text
 
+def _reshape_arabic(text: str) -> str:
+    if not AR_SUPPORT or not isinstance(text, str):
+        return text
+    return _shape(text)
+
 def ar(t: str) -> str:
     return _reshape_arabic(t) if AR_SUPPORT else t
 
@@ -90,7 +105,66 @@ else:
     APP_DIR = Path.home() / 'HeFedVideos'
 
 CONFIG_FILE = APP_DIR / 'config.json'
-DEFAULT_CONFIG = {'lang': 'ar'}
+STARTUP_LOG = APP_DIR / 'startup_log.json'
+
+class StartupProfiler:
+    """
+    Per-phase breakdown of cold start. phase() times a block, mark() stamps a milestone
+    relative to process start (_T0). report() prints the table once the app is usable and
+    appends it to startup_log.json (last KEEP runs) so regressions show up between builds.
+    """
+    KEEP = 20
+
+    def __init__(self, t0, path):
+        self.t0 = t0
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._phases = []
+        self._marks = []
+        self._reported = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self._lock: self._phases.append((name, seconds))
+
+    def mark(self, name):
+        with self._lock: self._marks.append((name, time.perf_counter() - self.t0))
+
+    def report(self):
+        with self._lock:
+            if self._reported: return
+            self._reported = True
+            phases, marks = list(self._phases), list(self._marks)
+        lines = ['Startup timings:']
+        lines += [f'  {name:<14}{sec * 1000:9.1f} ms' for name, sec in phases]
+        lines += [f'  @{name:<13}{sec * 1000:9.1f} ms' for name, sec in marks]
+        print('\n'.join(lines))
+        run = {'date': datetime.now().isoformat(timespec='seconds'),
+               'phases': {name: round(sec * 1000, 1) for name, sec in phases},
+               'marks': {name: round(sec * 1000, 1) for name, sec in marks}}
+        try:
+            runs = json.loads(self.path.read_text(encoding='utf-8')) if self.path.exists() else []
+            runs = (runs + [run])[-self.KEEP:]
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            tmp.write_text(json.dumps(runs, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print('Error saving startup log:', e)
+
+startup_profiler = StartupProfiler(_T0, STARTUP_LOG)
+DEFAULT_CONFIG = {'lang': 'ar', 'max_downloads': 2, 'extract_cache_entries': 200, 'extract_cache_ttl': 6*3600,
+                  'batch_extract_workers': 4, 'batch_lookahead': 6, 'progress_fps': 8,
+                  'adaptive_fragments': True, 'max_fragment_concurrency': 8,
+                  'format_profile': 'balanced', 'format_profiles': {}, 'content_hash': False,
+                  'player_idle_release': 60, 'storage_quota_mb': 0}
 
 def load_config():
     try:
@@ -134,6 +208,8 @@ TRANSLATIONS = {
     'clear_all_videos': {'en': 'Clear all videos', 'ar': 'مسح كل الفيديوهات'},
     'open_video_folder': {'en': 'Open videos folder', 'ar': 'فتح مجلد الفيديوهات'},
     'files_info': {'en': 'Files: {count} • {size}', 'ar': 'عدد الملفات: {count} • {size}'},
+    'storage_breakdown': {'en': 'Videos {videos} • Thumbnails {thumbs} • Partial {partials}',
+                          'ar': 'الفيديوهات {videos} • الصور المصغرة {thumbs} • غير مكتملة {partials}'},
     'confirm_clear_title': {'en': 'Confirm', 'ar': 'تأكيد'},
     'confirm_clear_text': {'en': 'All videos will be deleted. Continue?', 'ar': 'سيتم حذف كل الفيديوهات. متابعة؟'},
     'opening_path': {'en': 'Video path: {path}', 'ar': 'مسار الفيديو: {path}'},
@@ -146,42 +222,600 @@ TRANSLATIONS = {
     'volume': {'en': 'Vol:', 'ar': 'صوت:'},
     'play_pause': {'en': 'Play/Pause', 'ar': 'تشغيل/إيقاف مؤقت'},
     'stop': {'en': 'Stop/Pause', 'ar': 'إيقاف/إيقاف مؤقت'},
+    'queued': {'en': 'Queued', 'ar': 'في الانتظار'},
+    'paused': {'en': 'Paused', 'ar': 'متوقف مؤقتاً'},
+    'cancelled': {'en': 'Cancelled', 'ar': 'تم الإلغاء'},
+    'download_failed': {'en': 'Download failed', 'ar': 'فشل التحميل'},
+    'format_profile': {'en': 'Quality: {name}', 'ar': 'الجودة: {name}'},
+    'storage_quota': {'en': 'Storage limit: {size}', 'ar': 'حد التخزين: {size}'},
+    'unlimited': {'en': 'Unlimited', 'ar': 'بلا حد'},
+    'deleting': {'en': 'Deleting {done}/{total}...', 'ar': 'جاري الحذف {done}/{total}...'},
+    'deleted_count': {'en': 'Deleted {count} video(s)', 'ar': 'تم حذف {count} فيديو'},
+    'reconcile_report': {'en': 'Library synced: {missing} missing removed • {untracked} added • {orphans} leftovers cleaned',
+                         'ar': 'تمت مزامنة المكتبة: حذف {missing} مفقود • إضافة {untracked} • تنظيف {orphans} ملف'},
+    'already_downloaded': {'en': 'Already in library: {title}', 'ar': 'موجود في المكتبة: {title}'},
+    'search': {'en': 'Search...', 'ar': 'بحث...'},
+    'sort_by': {'en': 'Sort: {field}', 'ar': 'ترتيب: {field}'},
+    'sort_date': {'en': 'Date', 'ar': 'التاريخ'},
+    'sort_title': {'en': 'Title', 'ar': 'العنوان'},
+    'sort_size': {'en': 'Size', 'ar': 'الحجم'},
+    'sort_duration': {'en': 'Duration', 'ar': 'المدة'},
+    'sort_platform': {'en': 'Platform', 'ar': 'المنصة'},
+    'all_platforms': {'en': 'All platforms', 'ar': 'كل المنصات'},
+    'batch_started': {'en': 'Resolving {count} link(s)...', 'ar': 'جاري تحليل {count} رابط...'},
 }
 
+def _is_rtl(text):
+    for ch in text:
+        d = unicodedata.bidirectional(ch)
+        if d in ('R', 'AL'): return True
+        if d == 'L': return False
+    return False
+
+def _has_rtl(text):
+    return any(unicodedata.bidirectional(ch) in ('R', 'AL') for ch in text)
+
+class _Template:
+    """
+    One TRANSLATIONS string compiled for a language. The bare string is shaped once; for an
+    RTL template each literal run between {fields} is shaped once as well, so tr() with
+    arguments only shapes the arguments and lays the runs out right to left. Fields joined
+    by neutral text only ('{done}/{total}') form one LTR run under the bidi algorithm, so
+    such templates are shaped whole on every call instead.
+    """
+    __slots__ = ('source', 'lang', 'shaped', 'pieces')
+
+    def __init__(self, source, lang):
+        self.source = source
+        self.lang = lang
+        self.shaped = ar(source) if lang == 'ar' else source
+        self.pieces = None
+        if lang == 'ar' and AR_SUPPORT and '{' in source and _is_rtl(source):
+            try:
+                pieces = []
+                for literal, field, spec, conv in string.Formatter().parse(source):
+                    if pieces and pieces[-1][1] is not None and field is not None and not _has_rtl(literal):
+                        raise ValueError(literal)
+                    if literal: pieces.append((_shape(literal, 'R'), None, None))
+                    if field is not None:
+                        if not field.isidentifier() or conv: raise ValueError(field)
+                        pieces.append((None, field, spec))
+                self.pieces = pieces
+            except ValueError:
+                self.pieces = None
+
+    def render(self, kwargs):
+        if not kwargs: return self.shaped
+        if self.pieces is not None:
+            try:
+                out = [text if field is None else ar(format(kwargs[field], spec)) for text, field, spec in self.pieces]
+                return ''.join(reversed(out))
+            except Exception:
+                return self.shaped
+        try:
+            s = self.source.format(**kwargs)
+        except Exception:
+            s = self.source
+        return ar(s) if self.lang == 'ar' else s
+
+_TR_TABLES = {}
+
+def _translation_table(lang):
+    table = _TR_TABLES.get(lang)
+    if table is None:
+        table = _TR_TABLES[lang] = {k: _Template(v.get(lang, v.get('en', k)), lang) for k, v in TRANSLATIONS.items()}
+    return table
+
 def tr(key: str, **kwargs) -> str:
-    s = TRANSLATIONS.get(key, {}).get(LANG)
-    if s is None:
-        s = TRANSLATIONS.get(key, {}).get('en', key)
-    try:
-        s = s.format(**kwargs) if kwargs else s
-    except Exception:
-        pass
-    if LANG == 'ar':
-        return ar(s)
-    return s
+    t = _translation_table(LANG).get(key)
+    if t is None:
+        t = _Template(key, LANG)
+    return t.render(kwargs)
 
 VIDEO_DIR = APP_DIR / 'videos'
 DB_FILE = APP_DIR / 'videos.json'
+LIBRARY_DB = APP_DIR / 'library.db'
+JOURNAL_FILE = APP_DIR / 'jobs.json'
+SCAN_INDEX_FILE = APP_DIR / 'scan_index.json'
+SEEK_MODES_FILE = APP_DIR / 'seek_modes.json'
 THUMBS_DIR = APP_DIR / 'thumbs'
-APP_DIR.mkdir(parents=True, exist_ok=True)
-VIDEO_DIR.mkdir(parents=True, exist_ok=True)
-THUMBS_DIR.mkdir(parents=True, exist_ok=True)
+def ensure_dirs():
+    for d in (APP_DIR, VIDEO_DIR, THUMBS_DIR):
+        try: d.mkdir(parents=True, exist_ok=True)
+        except Exception as e: print('Error creating', d, e)
+
+class StorageAccountant:
+    """
+    Running disk-usage totals for VIDEO_DIR and THUMBS_DIR split into videos, thumbs and
+    partials (unfinished .part/.ytdl files). Writers report files through note()/forget()
+    so reading the totals never touches the disk; reconcile() re-counts with os.scandir on
+    a worker thread. Listeners get totals() on the Kivy main thread after every change.
+    """
+    CATEGORIES = ('videos', 'thumbs', 'partials')
+    PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp', '.tmp')
+
+    def __init__(self, dirs):
+        self.dirs = [Path(d) for d in dirs]
+        self._lock = threading.Lock()
+        self._files = {}            # path -> (category, size)
+        self._scanning = None       # paths touched while a reconcile is running
+        self.reconciled_at = 0.0
+        self._listeners = []
+
+    def subscribe(self, listener):
+        if listener not in self._listeners: self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners: self._listeners.remove(listener)
+
+    def classify(self, path):
+        name = os.path.basename(path).lower()
+        if os.path.dirname(os.path.abspath(path)) == os.path.abspath(THUMBS_DIR):
+            return 'thumbs'
+        if name.endswith(self.PARTIAL_SUFFIXES) or '.part-frag' in name:
+            return 'partials'
+        return 'videos'
+
+    def totals(self):
+        out = {c: {'count': 0, 'size': 0} for c in self.CATEGORIES}
+        with self._lock:
+            for cat, size in self._files.values():
+                out[cat]['count'] += 1; out[cat]['size'] += size
+        return out
+
+    def download_bytes(self, prefix):
+        """Bytes counted for an unfinished download's files: partials and intermediate streams under prefix."""
+        with self._lock:
+            return sum(size for p, (cat, size) in self._files.items()
+                       if p.startswith(prefix) and (cat == 'partials' or INTERMEDIATE_RE.search(p)))
+
+    def note(self, path):
+        """Record (or re-measure) a file that was written."""
+        if not path: return
+        path = str(path)
+        try: size = os.path.getsize(path)
+        except OSError: return self.forget(path)
+        with self._lock:
+            self._files[path] = (self.classify(path), size)
+            if self._scanning is not None: self._scanning.add(path)
+        self._emit()
+
+    def forget(self, path):
+        if not path: return
+        path = str(path)
+        with self._lock:
+            self._files.pop(path, None)
+            if self._scanning is not None: self._scanning.add(path)
+        self._emit()
+
+    def reconcile_async(self, max_age=0):
+        """Re-count in the background unless the last count is newer than max_age seconds."""
+        with self._lock:
+            if self._scanning is not None or (max_age and time.time() - self.reconciled_at < max_age): return
+            self._scanning = set()
+        threading.Thread(target=self._reconcile, daemon=True).start()
+
+    def reconcile(self):
+        """Re-count on the calling (worker) thread."""
+        with self._lock:
+            if self._scanning is None: self._scanning = set()
+        self._reconcile()
+
+    def _reconcile(self):
+        files = {}
+        try:
+            for d in self.dirs:
+                try:
+                    with os.scandir(d) as it:
+                        for de in it:
+                            if de.name.startswith('.') or not de.is_file(follow_symlinks=False): continue
+                            try: files[de.path] = (self.classify(de.path), de.stat(follow_symlinks=False).st_size)
+                            except OSError: pass
+                except FileNotFoundError:
+                    pass
+        except Exception as e:
+            print('Error scanning storage:', e)
+        with self._lock:
+            touched, self._scanning = self._scanning or set(), None
+            # writes that raced the scan are re-measured rather than trusted from either side
+            for path in touched:
+                try: files[path] = (self.classify(path), os.path.getsize(path))
+                except OSError: files.pop(path, None)
+            self._files = files
+            self.reconciled_at = time.time()
+        self._emit()
 
-def load_db():
-    if DB_FILE.exists():
+    @mainthread
+    def _emit(self):
+        totals = self.totals()
+        for cb in list(self._listeners):
+            try: cb(totals)
+            except Exception: traceback.print_exc()
+
+storage_accountant = StorageAccountant([VIDEO_DIR, THUMBS_DIR])
+
+class LibraryStore:
+    """
+    SQLite library (library.db, WAL mode) replacing the whole-file rewrites of videos.json.
+    Common fields are real columns (indexed on path, url and download date); anything else an
+    entry carries (timings, stats, format, ...) lives in the JSON 'extra' column. Every write is
+    a single-row (or single-batch) transaction, so concurrent workers cannot corrupt the file.
+    videos.json is imported once and renamed to videos.json.migrated.
+    """
+    COLUMNS = ('path', 'url', 'canonical_url', 'extractor_id', 'sha256', 'title', 'download_date',
+               'size', 'duration', 'platform', 'thumbnail')
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path, legacy_json=None):
+        self.path = Path(path)
+        self.legacy_json = Path(legacy_json) if legacy_json else None
+        self._lock = threading.RLock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn = conn
+            self._migrate()
+        return self._conn
+
+    def _migrate(self):
+        conn = self._conn
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < 1:
+            conn.execute('BEGIN')
+            conn.execute("""CREATE TABLE IF NOT EXISTS videos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL UNIQUE, url TEXT, canonical_url TEXT, extractor_id TEXT, sha256 TEXT,
+                title TEXT, download_date TEXT, size INTEGER, duration REAL, platform TEXT, thumbnail TEXT,
+                extra TEXT)""")
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_videos_url ON videos(url)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_videos_canonical ON videos(canonical_url)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_videos_date ON videos(download_date)')
+            conn.execute('PRAGMA user_version=1')
+            conn.execute('COMMIT')
+        self._import_legacy_json()
+
+    def _import_legacy_json(self):
+        src = self.legacy_json
+        if not src or not src.exists(): return
+        try:
+            entries = json.loads(src.read_text(encoding='utf-8'))
+        except Exception as e:
+            print('Error reading legacy videos.json:', e); return
+        with self._lock:
+            self._write_many([e for e in entries if isinstance(e, dict) and e.get('path')])
+        try: src.rename(src.with_name(src.name + '.migrated'))
+        except Exception as e: print('Error renaming legacy videos.json:', e)
+        print(f'[library] migrated {len(entries)} entries from {src.name}')
+
+    def _row_values(self, entry):
+        extra = {k: v for k, v in entry.items() if k not in self.COLUMNS}
+        return [entry.get(c) for c in self.COLUMNS] + [json.dumps(extra, ensure_ascii=False) if extra else None]
+
+    def _write_many(self, entries):
+        cols = ', '.join(self.COLUMNS + ('extra',))
+        marks = ', '.join('?' * (len(self.COLUMNS) + 1))
+        updates = ', '.join(f'{c}=excluded.{c}' for c in self.COLUMNS[1:] + ('extra',))
+        conn = self._db()
+        conn.execute('BEGIN')
         try:
-            return json.loads(DB_FILE.read_text(encoding='utf-8'))
+            conn.executemany(f'INSERT INTO videos ({cols}) VALUES ({marks}) ON CONFLICT(path) DO UPDATE SET {updates}',
+                             [self._row_values(e) for e in entries])
+            conn.execute('COMMIT')
         except Exception:
-            return []
-    return []
+            conn.execute('ROLLBACK'); raise
+
+    @classmethod
+    def _entry(cls, row):
+        entry = {c: row[c] for c in cls.COLUMNS if row[c] is not None}
+        if row['extra']:
+            try: entry.update(json.loads(row['extra']))
+            except Exception: pass
+        return entry
+
+    def all(self):
+        with self._lock:
+            return [self._entry(r) for r in self._db().execute('SELECT * FROM videos ORDER BY id')]
+
+    def put(self, entry):
+        """Insert or update (by path) one entry."""
+        self.put_many([entry])
+
+    def put_many(self, entries):
+        if not entries: return
+        with self._lock:
+            try: self._write_many(entries)
+            except Exception as e: print('Error saving library:', e)
+
+    def delete(self, path):
+        self.delete_many([path])
+
+    def delete_many(self, paths):
+        with self._lock:
+            try:
+                conn = self._db()
+                conn.execute('BEGIN')
+                conn.executemany('DELETE FROM videos WHERE path = ?', [(p,) for p in paths])
+                conn.execute('COMMIT')
+            except Exception as e:
+                print('Error deleting from library:', e)
 
-def save_db(db):
+library_store = LibraryStore(LIBRARY_DB, legacy_json=DB_FILE)
+
+def load_db():
     try:
-        DB_FILE.write_text(json.dumps(db, ensure_ascii=False, indent=2), encoding='utf-8')
+        return library_store.all()
     except Exception as e:
-        print('Error saving DB:', e)
+        print('Error loading library:', e)
+        return []
+
+class LibraryModel:
+    """
+    Resident copy of the library, loaded once from library_store. Mutations write through to
+    the store and keep dedupe_index in step; subscribers get listener(event, entry) on the Kivy
+    main thread with event in 'add', 'update', 'remove' or 'reset' (entry is None for reset).
+    """
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._entries = None
+        self._by_path = {}
+        self._listeners = []
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = load_db()
+            self._by_path = {e.get('path'): e for e in self._entries}
+
+    def entries(self):
+        with self._lock:
+            self._load()
+            return list(self._entries)
+
+    def get(self, path):
+        with self._lock:
+            self._load()
+            return self._by_path.get(path)
+
+    def subscribe(self, listener):
+        if listener not in self._listeners: self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self._listeners: self._listeners.remove(listener)
+
+    @mainthread
+    def _emit(self, event, entry):
+        for listener in list(self._listeners):
+            try: listener(event, entry)
+            except Exception: traceback.print_exc()
+
+    def add(self, entry):
+        with self._lock:
+            self._load()
+            old = self._by_path.get(entry.get('path'))
+            if old is not None:
+                old.update(entry); entry = old
+            else:
+                self._entries.append(entry); self._by_path[entry.get('path')] = entry
+            self.store.put(entry)
+        dedupe_index.add(entry)
+        self._emit('update' if old is not None else 'add', entry)
+        return entry
+
+    def update(self, entry, **changes):
+        self.update_many({entry.get('path'): changes})
+
+    def update_many(self, changes):
+        """changes: {path: {field: value}}; one store transaction, one 'update' event per entry."""
+        with self._lock:
+            self._load()
+            touched = []
+            for path, fields in changes.items():
+                e = self._by_path.get(path)
+                if e is not None:
+                    e.update(fields); touched.append(e)
+            self.store.put_many(touched)
+        for e in touched: self._emit('update', e)
+
+    def remove(self, path):
+        self.remove_many([path])
+
+    # bigger removals are announced as one 'reset' so views re-read once instead of per entry
+    RESET_THRESHOLD = 16
+
+    def remove_many(self, paths):
+        with self._lock:
+            self._load()
+            gone = [self._by_path.pop(p) for p in paths if p in self._by_path]
+            if gone:
+                ids = {id(e) for e in gone}
+                self._entries[:] = [e for e in self._entries if id(e) not in ids]
+                self.store.delete_many([e.get('path') for e in gone])
+        if len(gone) > self.RESET_THRESHOLD:
+            dedupe_index.reset()
+            self._emit('reset', None); return
+        for e in gone:
+            dedupe_index.remove(e)
+            self._emit('remove', e)
+
+    @property
+    def loaded(self):
+        return self._entries is not None
+
+    def preload(self):
+        """Load the store off the UI thread at startup; subscribers get a 'reset' once it is in."""
+        with self._lock:
+            if self._entries is not None: return
+            self._load()
+        self._emit('reset', None)
+
+    def reload(self):
+        """Re-read everything from the store (e.g. after an external change)."""
+        with self._lock:
+            self._entries = None
+            self._load()
+        dedupe_index.reset()
+        self._emit('reset', None)
+
+library = LibraryModel(library_store)
+
+# Arabic letter variants folded to one form, plus Arabic-Indic digits -> ASCII
+_AR_FOLD = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ى': 'ي', 'ی': 'ي', 'ئ': 'ي', 'ؤ': 'و',
+                          'ة': 'ه', 'ک': 'ك', 'ـ': None,
+                          **{chr(0x0660 + i): str(i) for i in range(10)}, **{chr(0x06F0 + i): str(i) for i in range(10)}})
+
+def normalize_search(text):
+    """Case-folded text without Latin accents or Arabic diacritics/tatweel and with unified letter forms."""
+    text = unicodedata.normalize('NFKD', str(text or '')).translate(_AR_FOLD)
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+
+class LibrarySearchIndex:
+    """
+    Title search over the library, kept current from LibraryModel events.
+    Terms of three or more characters match anywhere in a title (one str.find pass over a
+    concatenated blob of normalised titles); shorter terms match word prefixes through a sorted
+    token list. Sort orders are computed once per library change and reused by every query;
+    per-platform count/size/duration aggregates are maintained incrementally.
+    """
+    SORT_KEYS = {
+        'date': lambda e: str(e.get('download_date') or ''),
+        'title': None,  # uses the normalised title already held by the index
+        'size': lambda e: e.get('size') or 0,
+        'duration': lambda e: e.get('duration') or 0,
+        'platform': lambda e: (e.get('platform') or '').casefold(),
+    }
+    _WORD_RE = re.compile(r'\w+')
+
+    def __init__(self, model):
+        self.model = model
+        self._built = False
+        model.subscribe(self._on_event)
+
+    def _reset(self):
+        self._ids = itertools.count()
+        self._docs = {}        # doc id -> entry
+        self._by_path = {}     # path -> doc id
+        self._norm = {}        # doc id -> normalised title
+        self._tokens = []      # sorted (token, doc id)
+        self._blob_parts = []; self._blob = None; self._starts = []; self._blob_ids = []
+        self._dead = 0
+        self._orders = {}      # sort key -> (doc ids ascending, {doc id: rank})
+        self._platform_docs = {}
+        self.platforms = {}    # platform -> {'count', 'size', 'duration'}
+
+    def _ensure(self):
+        if self._built: return
+        self._reset()
+        for e in self.model.entries(): self._index(e, bulk=True)
+        self._tokens.sort()
+        self._built = True
+
+    def _index(self, entry, bulk=False):
+        doc = next(self._ids)
+        norm = normalize_search(entry.get('title'))
+        self._docs[doc] = entry; self._by_path[entry.get('path')] = doc; self._norm[doc] = norm
+        for tok in set(self._WORD_RE.findall(norm)):
+            if bulk: self._tokens.append((tok, doc))
+            else: bisect.insort(self._tokens, (tok, doc))
+        self._blob_parts.append((norm, doc)); self._blob = None
+        self._platform_docs.setdefault(entry.get('platform') or 'Unknown', set()).add(doc)
+        agg = self.platforms.setdefault(entry.get('platform') or 'Unknown', {'count': 0, 'size': 0, 'duration': 0})
+        agg['count'] += 1; agg['size'] += entry.get('size') or 0; agg['duration'] += entry.get('duration') or 0
+        self._orders = {}
+
+    def _unindex(self, path):
+        doc = self._by_path.pop(path, None)
+        if doc is None: return
+        entry = self._docs.pop(doc); self._norm.pop(doc, None)
+        self._platform_docs.get(entry.get('platform') or 'Unknown', set()).discard(doc)
+        agg = self.platforms.get(entry.get('platform') or 'Unknown')
+        if agg:
+            agg['count'] -= 1; agg['size'] -= entry.get('size') or 0; agg['duration'] -= entry.get('duration') or 0
+            if agg['count'] <= 0: self.platforms.pop(entry.get('platform') or 'Unknown', None)
+        self._dead += 1
+        self._orders = {}; self._blob = None
+        if self._dead > 1000 and self._dead > len(self._docs):
+            self._built = False  # too many tombstones in the token list / blob: rebuild lazily
+
+    def _on_event(self, event, entry):
+        if not self._built: return
+        if event == 'reset':
+            self._built = False
+        elif event == 'add':
+            self._index(entry)
+        elif event == 'remove':
+            self._unindex(entry.get('path'))
+        elif event == 'update':
+            self._unindex(entry.get('path')); self._index(entry)
+
+    def _substring(self, term):
+        if self._blob is None:
+            self._blob_parts = [(n, d) for n, d in self._blob_parts if d in self._docs]
+            self._starts = []; self._blob_ids = []; pos = 0
+            for n, d in self._blob_parts:
+                self._starts.append(pos); self._blob_ids.append(d); pos += len(n) + 1
+            self._blob = '\n'.join(n for n, _ in self._blob_parts)
+        found = set(); blob = self._blob; starts = self._starts
+        pos = blob.find(term)
+        while pos != -1:
+            i = bisect.bisect_right(starts, pos) - 1
+            if self._blob_ids[i] in self._docs: found.add(self._blob_ids[i])
+            nxt = starts[i + 1] if i + 1 < len(starts) else len(blob)
+            pos = blob.find(term, nxt)
+        return found
+
+    def _prefix(self, term):
+        found = set(); toks = self._tokens
+        i = bisect.bisect_left(toks, (term, -1))
+        while i < len(toks) and toks[i][0].startswith(term):
+            if toks[i][1] in self._docs: found.add(toks[i][1])
+            i += 1
+        return found
+
+    def _order(self, key):
+        cached = self._orders.get(key)
+        if cached is None:
+            keyfn = self.SORT_KEYS[key]; docs = self._docs
+            if keyfn is None:
+                norm = self._norm
+                order = sorted(docs, key=lambda d: (norm[d], d))
+            else:
+                order = sorted(docs, key=lambda d: (keyfn(docs[d]), d))
+            cached = self._orders[key] = (order, {d: i for i, d in enumerate(order)})
+        return cached
+
+    def query(self, text='', platform=None, sort='date', descending=True):
+        """Entries matching every term of text (and platform, if given) in the requested order."""
+        self._ensure()
+        matched = None
+        for term in normalize_search(text).split():
+            hits = self._substring(term) if len(term) >= 3 else self._prefix(term)
+            matched = hits if matched is None else matched & hits
+            if not matched: return []
+        if platform is not None:
+            pdocs = self._platform_docs.get(platform, set())
+            matched = pdocs if matched is None else matched & pdocs
+        order, rank = self._order(sort if sort in self.SORT_KEYS else 'date')
+        if matched is None:
+            ids = order[::-1] if descending else order
+        elif len(matched) * 8 < len(order):
+            ids = sorted(matched, key=rank.__getitem__, reverse=descending)
+        else:
+            ids = [d for d in order if d in matched]
+            if descending: ids.reverse()
+        docs = self._docs
+        return [docs[d] for d in ids]
 
-video_database = load_db()
+    def platform_stats(self):
+        self._ensure()
+        return {k: dict(v) for k, v in self.platforms.items()}
+
+search_index = LibrarySearchIndex(library)
 
 def human_size(n):
     try:
@@ -192,6 +826,14 @@ def human_size(n):
     if n > 1024**2: return f"{n/(1024**2):.1f} MB"
     return f"{n/1024:.1f} KB"
 
+def format_duration(s):
+    try:
+        s = int(float(s))
+    except Exception:
+        return '00:00'
+    mins, secs = divmod(s, 60); hours, mins = divmod(mins, 60)
+    return f"{hours:02d}:{mins:02d}:{secs:02d}" if hours else f"{mins:02d}:{secs:02d}"
+
 def show_message(txt, duration=2):
     try:
         d = MDDialog(text=txt)
@@ -201,23 +843,286 @@ def show_message(txt, duration=2):
         try: print(txt)
         except: pass
 
-def download_thumbnail(url, dest_path):
-    try:
-        import urllib.request
-        urllib.request.urlretrieve(url, dest_path)
-        return True
-    except Exception:
-        return False
+THUMB_SIZE = (int(dp(120)), int(dp(120)))  # VideoCard thumbnail box in pixels
+
+def save_thumbnail(img, dest_path):
+    """Downscale a Pillow image to the card's display size and store it as a compact JPEG."""
+    img.thumbnail(THUMB_SIZE)
+    if img.mode not in ('RGB', 'L'): img = img.convert('RGB')
+    img.save(dest_path, 'JPEG', quality=80, optimize=True)
+
+class ThumbnailIngestor:
+    """
+    Fetches remote thumbnails off the download critical path.
+    Keep-alive HTTP connections are reused per host (one pool per worker thread), concurrent
+    requests for the same destination share one future, and images are downscaled with Pillow
+    when it is available (otherwise the original bytes are stored).
+    """
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._local = threading.local()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hefed-thumbs')
+            return self._pool
+
+    def submit(self, url, dest_path, on_ready=None, on_failed=None):
+        """Queue url -> dest_path; on_ready(dest_path) / on_failed() are called from the worker."""
+        dest_path = str(dest_path)
+        pool = self._executor()
+        with self._lock:
+            fut = self._inflight.get(dest_path)
+            created = fut is None
+            if created:
+                fut = pool.submit(self._ingest, url, dest_path)
+                self._inflight[dest_path] = fut
+        if created: fut.add_done_callback(lambda f: self._forget(dest_path))
+        def done(f):
+            if f.result():
+                if on_ready: on_ready(dest_path)
+            elif on_failed:
+                on_failed()
+        if on_ready or on_failed: fut.add_done_callback(done)
+        return fut
+
+    def _forget(self, dest_path):
+        with self._lock:
+            self._inflight.pop(dest_path, None)
+
+    def _connection(self, scheme, netloc, fresh=False):
+        import http.client
+        conns = getattr(self._local, 'conns', None)
+        if conns is None: conns = self._local.conns = {}
+        key = (scheme, netloc)
+        if fresh and key in conns:
+            try: conns.pop(key).close()
+            except Exception: pass
+        if key not in conns:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conns[key] = cls(netloc, timeout=15)
+        return conns[key]
+
+    def _fetch(self, url, redirects=3):
+        parts = urlsplit(url)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        for attempt in (0, 1):
+            conn = self._connection(parts.scheme, parts.netloc, fresh=attempt > 0)
+            try:
+                conn.request('GET', path, headers={'User-Agent': 'Mozilla/5.0', 'Connection': 'keep-alive'})
+                resp = conn.getresponse()
+                data = resp.read()
+                break
+            except Exception:
+                if attempt: raise
+        if resp.status in (301, 302, 303, 307, 308) and redirects and resp.getheader('Location'):
+            from urllib.parse import urljoin
+            return self._fetch(urljoin(url, resp.getheader('Location')), redirects - 1)
+        if resp.status != 200:
+            raise IOError(f'HTTP {resp.status} for {url}')
+        return data
+
+    def _ingest(self, url, dest_path):
+        if os.path.exists(dest_path): return True
+        try:
+            data = self._fetch(url)
+            tmp = dest_path + '.tmp'
+            try:
+                from PIL import Image
+                import io
+                save_thumbnail(Image.open(io.BytesIO(data)), tmp)
+            except ImportError:
+                Path(tmp).write_bytes(data)
+            os.replace(tmp, dest_path)
+            return True
+        except Exception as e:
+            print('Thumbnail fetch failed:', url, e)
+            return False
 
-try:
-    import yt_dlp
-except Exception:
-    yt_dlp = None
+thumbnail_ingestor = ThumbnailIngestor()
+
+VIDEO_EXTS = {'.mp4', '.webm', '.mkv', '.mov', '.m4v', '.3gp', '.avi', '.flv', '.ts'}
+
+class LocalThumbnailer:
+    """
+    Builds thumbnails for local videos from a representative frame, without network access.
+    Backends are tried in order: Android MediaMetadataRetriever, ffpyplayer, the ffmpeg CLI.
+    Library scans run in batches on a small worker pool; files that could not be decoded are
+    remembered in THUMBS_DIR/.nothumb.json so they are not retried on every launch.
+    """
+    BATCH = 16
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._failed = None
+        self._failed_file = THUMBS_DIR / '.nothumb.json'
+        self._scanning = False
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hefed-frames')
+            return self._pool
 
-try:
-    from plyer import clipboard
-except Exception:
-    clipboard = None
+    @staticmethod
+    def thumb_path(video_path):
+        return THUMBS_DIR / (Path(video_path).stem + '.jpg')
+
+    def _failed_set(self):
+        with self._lock:
+            if self._failed is None:
+                try: self._failed = set(json.loads(self._failed_file.read_text(encoding='utf-8')))
+                except Exception: self._failed = set()
+            return self._failed
+
+    def _save_failed(self):
+        with self._lock:
+            try: self._failed_file.write_text(json.dumps(sorted(self._failed or [])), encoding='utf-8')
+            except Exception as e: print('Error saving thumbnail state:', e)
+
+    def submit(self, video_path, duration=0, on_ready=None):
+        fut = self._executor().submit(self.generate, str(video_path), duration)
+        if on_ready: fut.add_done_callback(lambda f: f.result() and on_ready(f.result()))
+        return fut
+
+    def scan_library(self, on_batch=None):
+        """Generate thumbnails for every video in VIDEO_DIR that has none, in a background thread."""
+        with self._lock:
+            if self._scanning: return
+            self._scanning = True
+        threading.Thread(target=self._scan, args=(on_batch or _local_thumbnails_ready,), daemon=True).start()
+
+    def _scan(self, on_batch):
+        try:
+            failed = self._failed_set()
+            durations = {e.get('path'): e.get('duration') for e in library.entries()}
+            todo = []
+            with os.scandir(VIDEO_DIR) as it:
+                for f in it:
+                    if (f.is_file() and os.path.splitext(f.name)[1].lower() in VIDEO_EXTS
+                            and f.path not in failed and not self.thumb_path(f.path).exists()):
+                        todo.append(f.path)
+            pool = self._executor()
+            for i in range(0, len(todo), self.BATCH):
+                batch = todo[i:i + self.BATCH]
+                made = {p: t for p, t in zip(batch, pool.map(lambda p: self.generate(p, durations.get(p)), batch)) if t}
+                self._save_failed()
+                if made: on_batch(made)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self._lock: self._scanning = False
+
+    def generate(self, video_path, duration=0):
+        dest = self.thumb_path(video_path)
+        if dest.exists(): return str(dest)
+        try: at = min(float(duration or 0) * 0.1, 30.0) or 1.0
+        except Exception: at = 1.0
+        tmp = str(dest) + '.tmp'
+        for backend in (self._android_frame, self._ffpyplayer_frame, self._ffmpeg_frame):
+            try:
+                if backend(video_path, at, tmp) and os.path.getsize(tmp) > 0:
+                    os.replace(tmp, dest)
+                    return str(dest)
+            except Exception as e:
+                print(f'Frame grab ({backend.__name__}) failed:', video_path, e)
+        try: os.remove(tmp)
+        except Exception: pass
+        self._failed_set().add(video_path)
+        return None
+
+    def _android_frame(self, src, at, dest):
+        if platform != 'android': return False
+        from jnius import autoclass
+        Retriever = autoclass('android.media.MediaMetadataRetriever')
+        Bitmap = autoclass('android.graphics.Bitmap')
+        CompressFormat = autoclass('android.graphics.Bitmap$CompressFormat')
+        FileOutputStream = autoclass('java.io.FileOutputStream')
+        r = Retriever()
+        try:
+            r.setDataSource(src)
+            bmp = r.getFrameAtTime(int(at * 1e6), Retriever.OPTION_CLOSEST_SYNC)
+            if bmp is None: return False
+            w, h = bmp.getWidth(), bmp.getHeight()
+            scale = min(THUMB_SIZE[0] / w, THUMB_SIZE[1] / h, 1.0)
+            bmp = Bitmap.createScaledBitmap(bmp, max(1, int(w * scale)), max(1, int(h * scale)), True)
+            out = FileOutputStream(dest)
+            try: bmp.compress(CompressFormat.JPEG, 80, out)
+            finally: out.close()
+            return True
+        finally:
+            r.release()
+
+    def _ffpyplayer_frame(self, src, at, dest):
+        try:
+            from ffpyplayer.player import MediaPlayer
+            from PIL import Image
+        except ImportError:
+            return False
+        player = MediaPlayer(src, ff_opts={'ss': at, 'an': True, 'out_fmt': 'rgb24'})
+        try:
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                frame, val = player.get_frame()
+                if val == 'eof': return False
+                if frame is None:
+                    time.sleep(0.01); continue
+                img, _ = frame
+                save_thumbnail(Image.frombytes('RGB', img.get_size(), bytes(img.to_bytearray()[0])), dest)
+                return True
+            return False
+        finally:
+            player.close_player()
+
+    def _ffmpeg_frame(self, src, at, dest):
+        import shutil, subprocess
+        exe = shutil.which('ffmpeg')
+        if not exe: return False
+        w, h = THUMB_SIZE
+        subprocess.run([exe, '-v', 'error', '-ss', f'{at:.2f}', '-i', src, '-frames:v', '1',
+                        '-vf', f'scale={w}:{h}:force_original_aspect_ratio=decrease',
+                        '-q:v', '5', '-f', 'image2', '-c:v', 'mjpeg', '-y', dest],
+                       check=True, timeout=30, stdin=subprocess.DEVNULL)
+        return os.path.exists(dest)
+
+local_thumbnailer = LocalThumbnailer()
+
+def _local_thumbnails_ready(made):
+    """Attach a batch of generated thumbnails ({video path: thumb path}) in one store write."""
+    changes = {}
+    for path, t in made.items():
+        e = library.get(path)
+        thumb = (e or {}).get('thumbnail') or ''
+        if e is not None and (not thumb or (not thumb.startswith('http') and not os.path.exists(thumb))):
+            changes[path] = {'thumbnail': t}
+    if changes: library.update_many(changes)
+    for t in made.values(): storage_accountant.note(t)
+
+def _thumbnail_ready(entry, path):
+    library.update(entry, thumbnail=path)
+    storage_accountant.note(path)
+
+_yt_dlp = None
+_yt_dlp_lock = threading.Lock()
+
+def load_yt_dlp():
+    """yt-dlp imported on first use (it is the slowest import by far); None if not installed."""
+    global _yt_dlp
+    with _yt_dlp_lock:
+        if _yt_dlp is None:
+            try:
+                import yt_dlp
+                _yt_dlp = yt_dlp
+            except Exception as e:
+                print('yt-dlp unavailable:', e)
+                _yt_dlp = False
+    return _yt_dlp or None
 
 # ---- حل مشكلة 'str object has no attribute write' عبر Logger مخصص ----
 class _YTDLPLogger:
@@ -234,124 +1139,1492 @@ class _YTDLPLogger:
         try: print('[yt-dlp][ERROR]', msg)
         except: pass
 
+class _JobLogger(_YTDLPLogger):
+    """Per-download logger that also counts fragment retries/skips for AdaptiveTuner."""
+    def __init__(self):
+        self.fragment_errors = 0
+        self.skipped_fragments = 0
+    def _count(self, msg):
+        msg = str(msg)
+        if 'Retrying fragment' in msg or 'fragment not found' in msg: self.fragment_errors += 1
+        if 'Skipping fragment' in msg: self.skipped_fragments += 1
+    def debug(self, msg):
+        self._count(msg); super().debug(msg)
+    def warning(self, msg):
+        self._count(msg); super().warning(msg)
+    def error(self, msg):
+        self._count(msg); super().error(msg)
+
+_TRACKING_PARAMS = {'fbclid', 'gclid', 'igshid', 'si', 'feature', 'ref', 'ref_src', 'app', 'pp'}
+_YOUTUBE_HOSTS = {'youtube.com', 'music.youtube.com', 'youtube-nocookie.com'}
+_YOUTUBE_PATH_ID = re.compile(r'^/(?:shorts|embed|live|v)/([\w-]{11})')
+
+def canonical_url(url: str) -> str:
+    """
+    Normalise a URL for use as a cache/dedupe key: lower-case host without www./m./mobile.,
+    no fragment, trailing slash or tracking parameters, sorted query. Every YouTube variant
+    (youtu.be, shorts, embed, m., &t=...) becomes https://youtube.com/watch?v=ID.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower() or 'https'
+        if scheme == 'http': scheme = 'https'
+        host = parts.netloc.lower().rsplit('@', 1)[-1]
+        if host.endswith(':443') or host.endswith(':80'): host = host.rsplit(':', 1)[0]
+        for prefix in ('www.', 'm.', 'mobile.'):
+            if host.startswith(prefix):
+                host = host[len(prefix):]; break
+        path = parts.path.rstrip('/') or '/'
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        vid = None
+        if host == 'youtu.be':
+            vid = path.strip('/').split('/')[0]
+        elif host in _YOUTUBE_HOSTS:
+            m = _YOUTUBE_PATH_ID.match(path)
+            vid = m.group(1) if m else (dict(query).get('v') if path == '/watch' else None)
+        if vid:
+            return f'https://youtube.com/watch?v={vid}'
+        query = sorted((k, v) for k, v in query if k.lower() not in _TRACKING_PARAMS and not k.lower().startswith('utm_'))
+        return urlunsplit((scheme, host, path, urlencode(query), ''))
+    except Exception:
+        return url.strip()
+
+def extractor_temp_id(url):
+    """'ExtractorKey:id' for url from yt-dlp's URL patterns alone (no network), or None."""
+    if load_yt_dlp() is None: return None
+    try:
+        from yt_dlp.extractor import gen_extractor_classes
+        for ie in gen_extractor_classes():
+            if ie.ie_key() != 'Generic' and ie.suitable(url):
+                tid = ie.get_temp_id(url)
+                return f'{ie.ie_key()}:{tid}' if tid else None
+    except Exception:
+        pass
+    return None
+
+class DedupeIndex:
+    """
+    O(1) lookup of library entries by canonical URL, extractor:id and (optional) content hash.
+    Built lazily from the library model, which keeps it current via add/remove/reset.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._map = {}
+
+    @staticmethod
+    def _keys(entry):
+        keys = []
+        if entry.get('url'): keys.append('url:' + (entry.get('canonical_url') or canonical_url(entry['url'])))
+        if entry.get('extractor_id'): keys.append('id:' + entry['extractor_id'])
+        if entry.get('sha256'): keys.append('sha:' + entry['sha256'])
+        return keys
+
+    def _sync(self):
+        if self._built: return
+        self._built = True
+        self._map = {}
+        for e in library.entries():
+            for k in self._keys(e): self._map[k] = e
+
+    def reset(self):
+        with self._lock:
+            self._built = False; self._map = {}
+
+    def add(self, entry):
+        with self._lock:
+            self._sync()
+            for k in self._keys(entry): self._map[k] = entry
+
+    def remove(self, entry):
+        with self._lock:
+            self._sync()
+            for k in self._keys(entry):
+                if self._map.get(k) is entry: del self._map[k]
+
+    def find(self, url=None, extractor_id=None, sha256=None):
+        """Existing entry (whose file is still on disk) matching any of the given keys."""
+        keys = []
+        if url: keys.append('url:' + canonical_url(url))
+        if extractor_id: keys.append('id:' + extractor_id)
+        if sha256: keys.append('sha:' + sha256)
+        with self._lock:
+            self._sync()
+            for k in keys:
+                e = self._map.get(k)
+                if e is not None and os.path.exists(e.get('path') or ''): return e
+        return None
+
+dedupe_index = DedupeIndex()
+
+class _StreamHasher:
+    """SHA-256 of a file that is still being written, fed with the bytes appended since the last call."""
+    def __init__(self):
+        self.path = None
+        self.offset = 0
+        self._h = hashlib.sha256()
+
+    def feed(self, path):
+        if path != self.path:
+            self.path, self.offset, self._h = path, 0, hashlib.sha256()
+        try:
+            with open(path, 'rb') as f:
+                f.seek(self.offset)
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    self._h.update(chunk); self.offset += len(chunk)
+        except OSError:
+            pass
+
+    def renamed(self, old, new):
+        if old and old == self.path: self.path = new
+
+    def digest(self, path):
+        self.feed(path)
+        return self._h.hexdigest()
+
+class ExtractionCache:
+    """
+    On-disk cache of yt-dlp extraction results under APP_DIR/cache/extract.
+    One JSON file per canonical URL plus an index.json holding expiry, last use and size,
+    bounded by entry count and bytes with least-recently-used eviction.
+    """
+    # googlevideo & co. sign format URLs with an expiry timestamp (query or path style)
+    _EXPIRE_RE = re.compile(r'[/?&]expires?[=/](\d{9,11})')
+    EXPIRY_MARGIN = 300  # keep a few minutes so a cached URL does not expire mid-download
+
+    def __init__(self, root, max_entries=200, max_bytes=64*1024**2, ttl=6*3600):
+        self.root = Path(root)
+        self.index_file = self.root / 'index.json'
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None  # key -> {'url', 'expires', 'used', 'size'}
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha1(canonical_url(url).encode('utf-8')).hexdigest()
+
+    def _load(self):
+        if self._index is not None: return
+        self._index = {}
+        try:
+            data = json.loads(self.index_file.read_text(encoding='utf-8'))
+            self._index = data.get('entries', {})
+            self.hits = data.get('hits', 0); self.misses = data.get('misses', 0)
+        except Exception:
+            pass
+
+    def _save(self):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = self.index_file.with_suffix('.tmp')
+            tmp.write_text(json.dumps({'entries': self._index, 'hits': self.hits, 'misses': self.misses}), encoding='utf-8')
+            os.replace(tmp, self.index_file)
+        except Exception as e:
+            print('Error saving extraction cache:', e)
+
+    def _drop(self, key):
+        self._index.pop(key, None)
+        try: (self.root / (key + '.json')).unlink()
+        except Exception: pass
+
+    def _evict(self):
+        entries = sorted(self._index.items(), key=lambda kv: kv[1].get('used', 0))
+        total = sum(m.get('size', 0) for _, m in entries)
+        while entries and (len(self._index) > self.max_entries or total > self.max_bytes):
+            key, meta = entries.pop(0)
+            total -= meta.get('size', 0); self._drop(key)
+
+    def _ttl_for(self, info):
+        formats = [info] + list(info.get('requested_formats') or info.get('formats') or [])
+        expiries = []
+        for f in formats:
+            m = self._EXPIRE_RE.search(f.get('url') or '') if isinstance(f, dict) else None
+            if m: expiries.append(int(m.group(1)))
+        ttl = self.ttl
+        if expiries:
+            ttl = min(ttl, min(expiries) - time.time() - self.EXPIRY_MARGIN)
+        return ttl
+
+    def get(self, url):
+        key = self._key(url); now = time.time()
+        with self._lock:
+            self._load()
+            meta = self._index.get(key)
+            if meta and meta.get('expires', 0) > now:
+                try:
+                    info = json.loads((self.root / (key + '.json')).read_text(encoding='utf-8'))
+                except Exception:
+                    info = None
+                if info is not None:
+                    meta['used'] = now; self.hits += 1; self._save()
+                    return info
+            if meta: self._drop(key)
+            self.misses += 1; self._save()
+            return None
+
+    def put(self, url, info):
+        if not isinstance(info, dict): return
+        ttl = self._ttl_for(info)
+        if ttl <= 0: return
+        key = self._key(url); now = time.time()
+        try:
+            data = json.dumps(info, ensure_ascii=False)
+        except Exception:
+            return
+        with self._lock:
+            self._load()
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+                tmp = self.root / (key + '.tmp')
+                tmp.write_text(data, encoding='utf-8')
+                os.replace(tmp, self.root / (key + '.json'))
+            except Exception as e:
+                print('Error writing extraction cache:', e); return
+            self._index[key] = {'url': canonical_url(url), 'expires': now + ttl, 'used': now, 'size': len(data)}
+            self._evict(); self._save()
+
+    def expires(self, info):
+        """Time after which info's signed format URLs should no longer be used."""
+        return time.time() + self._ttl_for(info)
+
+    def invalidate(self, url):
+        key = self._key(url)
+        with self._lock:
+            self._load()
+            if key in self._index:
+                self._drop(key); self._save()
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._index),
+                    'bytes': sum(m.get('size', 0) for m in self._index.values())}
+
+extraction_cache = ExtractionCache(APP_DIR / 'cache' / 'extract',
+                                   max_entries=config.get('extract_cache_entries', 200),
+                                   ttl=config.get('extract_cache_ttl', 6*3600))
+
+class DownloadJournal:
+    """
+    Crash-safe record of unfinished downloads (jobs.json next to videos.json).
+    State/format/filename changes are written immediately via an atomic rename; byte counts
+    are throttled to one write every `interval` seconds. Finished jobs are dropped.
+    """
+    def __init__(self, path, interval=2.0):
+        self.path = Path(path)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._records = None
+        self._last_write = 0.0
+
+    def _load(self):
+        if self._records is not None: return
+        self._records = {}
+        try:
+            if self.path.exists():
+                self._records = {r['key']: r for r in json.loads(self.path.read_text(encoding='utf-8')) if r.get('key')}
+        except Exception as e:
+            print('Error reading download journal:', e)
+
+    def _write(self):
+        try:
+            tmp = self.path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(list(self._records.values()), ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp, self.path)
+            self._last_write = time.monotonic()
+        except Exception as e:
+            print('Error saving download journal:', e)
+
+    def track(self, job):
+        with self._lock:
+            self._load()
+            if job.state in ('done', 'error', 'cancelled'):
+                if self._records.pop(job.key, None) is not None: self._write()
+                return
+            old = self._records.get(job.key) or {}
+            rec = {'key': job.key, 'url': job.url, 'title': job.title, 'priority': job.priority,
+                   'state': 'paused' if job.state == 'paused' else 'queued',
+                   'format': job.format_id, 'filename': job.filename, 'tmpfilename': job.tmpfilename,
+                   'downloaded': job.downloaded, 'total': job.total}
+            self._records[job.key] = rec
+            changed = any(old.get(k) != rec[k] for k in ('state', 'format', 'filename', 'tmpfilename', 'priority'))
+            if changed or time.monotonic() - self._last_write >= self.interval:
+                self._write()
+
+    def unfinished(self):
+        with self._lock:
+            self._load()
+            return [dict(r) for r in self._records.values()]
+
+class ProgressAggregator:
+    """
+    Coalesces job updates coming from yt-dlp hook threads into one main-thread tick per UI frame.
+    Only the latest state of each job is kept; on every tick smoothed speed/ETA are computed and
+    each listener receives a single batched call with all of its jobs that changed.
+    """
+    ALPHA = 0.3  # weight of the newest speed sample in the moving average
+
+    def __init__(self, fps=8):
+        self.frame = 1.0 / max(1, fps)
+        self._lock = threading.Lock()
+        self._dirty = {}
+        self._scheduled = False
+        self._samples = {}  # job id -> (monotonic time, downloaded bytes)
+
+    def mark(self, job):
+        with self._lock:
+            self._dirty[job.id] = job
+            if self._scheduled: return
+            self._scheduled = True
+        Clock.schedule_once(self._tick, self.frame)
+
+    def _measure(self, job, now):
+        last = self._samples.get(job.id)
+        if job.state != 'running':
+            self._samples.pop(job.id, None); job.speed = 0.0; job.eta = None
+            return
+        self._samples[job.id] = (now, job.downloaded)
+        if not last or now <= last[0]: return
+        inst = max(0, job.downloaded - last[1]) / (now - last[0])
+        job.speed = inst if not job.speed else self.ALPHA * inst + (1 - self.ALPHA) * job.speed
+        job.eta = (job.total - job.downloaded) / job.speed if job.speed and job.total > job.downloaded else None
+
+    def _tick(self, dt):
+        with self._lock:
+            jobs = list(self._dirty.values())
+            self._dirty.clear(); self._scheduled = False
+        now = time.monotonic()
+        batches = {}
+        for job in jobs:
+            self._measure(job, now)
+            if job.listener: batches.setdefault(job.listener, []).append(job)
+        for listener, group in batches.items():
+            try: listener(group)
+            except Exception: traceback.print_exc()
+
+class AdaptiveTuner:
+    """
+    Per-site fragment concurrency and HTTP chunk size for yt-dlp, re-tuned after every finished file.
+    While throughput keeps improving without fragment errors the setting is raised step by step
+    (concurrency for HLS/DASH, chunk size for plain HTTP); retries or skipped fragments halve both.
+    """
+    MIN_CHUNK = 1024**2
+    MAX_CHUNK = 32 * 1024**2
+    GAIN = 1.05  # throughput must beat the best seen by 5% to keep growing
+
+    def __init__(self, max_concurrency=8, enabled=True):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._sites = {}
+
+    @staticmethod
+    def site(url):
+        try:
+            host = urlsplit(url).netloc.lower()
+            return host[4:] if host.startswith('www.') else host
+        except Exception:
+            return ''
+
+    def _state(self, url):
+        return self._sites.setdefault(self.site(url), {'concurrency': 2, 'chunk_size': 4 * 1024**2, 'best': 0.0})
+
+    def throughput(self, url):
+        """Best bytes/s observed for the site of url (0 when nothing was measured yet)."""
+        with self._lock:
+            st = self._sites.get(self.site(url))
+            return st['best'] if st else 0.0
+
+    def settings(self, url):
+        with self._lock:
+            st = self._state(url)
+            return {'concurrency': st['concurrency'], 'chunk_size': st['chunk_size']}
+
+    def apply(self, params, settings):
+        if not self.enabled: return
+        params['concurrent_fragment_downloads'] = settings['concurrency']
+        params['http_chunk_size'] = settings['chunk_size']
+
+    def observe(self, url, throughput, errors, fragmented):
+        with self._lock:
+            st = self._state(url)
+            if errors:
+                st['concurrency'] = max(1, st['concurrency'] // 2)
+                st['chunk_size'] = max(self.MIN_CHUNK, st['chunk_size'] // 2)
+                st['best'] = throughput
+            elif throughput >= st['best'] * self.GAIN:
+                st['best'] = throughput
+                if fragmented: st['concurrency'] = min(self.max_concurrency, st['concurrency'] + 1)
+                else: st['chunk_size'] = min(self.MAX_CHUNK, int(st['chunk_size'] * 1.5))
+            return {'concurrency': st['concurrency'], 'chunk_size': st['chunk_size']}
+
+class FormatSelector:
+    """
+    Picks the yt-dlp format per download from a named profile (config 'format_profile').
+    Profiles come from DEFAULT_FORMAT_PROFILES merged with config 'format_profiles' and may set
+    max_height, target_kbps (bitrate ceiling), adaptive (cap bitrate by the throughput measured
+    for the site) or a raw yt-dlp 'format' spec. Every profile also refuses formats whose
+    estimated size would leave less than DISK_RESERVE free in VIDEO_DIR. When ffmpeg is
+    available, video-only streams paired with the best matching audio compete with the muxed
+    formats, so heights above the site's best progressive stream are reachable.
+    """
+    DEFAULT_FORMAT_PROFILES = {
+        'balanced': {'max_height': 720},
+        'data_saver': {'max_height': 480, 'target_kbps': 700},
+        'high': {'max_height': 1080},
+        'auto': {'max_height': 1080, 'adaptive': True},
+    }
+    DISK_RESERVE = 200 * 1024**2
+    AUDIO_EXT = {'mp4': 'm4a', 'webm': 'webm'}   # audio that merges into the video's container
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def can_merge():
+        import shutil
+        return shutil.which('ffmpeg') is not None
+
+    def profiles(self):
+        merged = dict(self.DEFAULT_FORMAT_PROFILES)
+        merged.update(config.get('format_profiles') or {})
+        return merged
+
+    def profile_name(self):
+        name = config.get('format_profile', 'balanced')
+        return name if name in self.profiles() else 'balanced'
+
+    @staticmethod
+    def _kbps(f, duration):
+        if f.get('requested_formats'): return sum(FormatSelector._kbps(p, duration) for p in f['requested_formats'])
+        if f.get('tbr'): return float(f['tbr'])
+        size = f.get('filesize') or f.get('filesize_approx')
+        return size * 8 / 1000 / duration if size and duration else 0.0
+
+    @staticmethod
+    def _size(f, duration):
+        if f.get('requested_formats'): return sum(FormatSelector._size(p, duration) for p in f['requested_formats'])
+        size = f.get('filesize') or f.get('filesize_approx')
+        if not size and f.get('tbr') and duration: size = f['tbr'] * 1000 / 8 * duration
+        return size or 0
+
+    def _pairs(self, formats, duration):
+        """Every video-only format merged with the best audio-only format for its container."""
+        videos = [f for f in formats if f.get('url') and f.get('vcodec') not in (None, 'none') and f.get('acodec') == 'none']
+        audios = [f for f in formats if f.get('url') and f.get('acodec') not in (None, 'none') and f.get('vcodec') == 'none']
+        if not videos or not audios: return []
+        best_audio = lambda pool: max(pool, key=lambda a: (a.get('abr') or 0, self._kbps(a, duration)))
+        pairs = []
+        for v in videos:
+            same = [a for a in audios if a.get('ext') == self.AUDIO_EXT.get(v.get('ext'))]
+            a = best_audio(same or audios)
+            pairs.append({
+                'format_id': f"{v['format_id']}+{a['format_id']}", 'requested_formats': [v, a],
+                'ext': v.get('ext') if same else 'mkv', 'protocol': f"{v.get('protocol')}+{a.get('protocol')}",
+                'vcodec': v.get('vcodec'), 'acodec': a.get('acodec'), 'width': v.get('width'),
+                'height': v.get('height'), 'fps': v.get('fps'), 'tbr': (v.get('tbr') or 0) + (a.get('tbr') or 0) or None,
+            })
+        return pairs
+
+    def choose(self, formats, url, duration=0):
+        """Return (format dict, profile name, human readable reason) or (None, name, reason)."""
+        name = self.profile_name(); prof = self.profiles()[name]
+        both = [f for f in formats if f.get('vcodec') != 'none' and f.get('acodec') != 'none' and f.get('url')]
+        if self.can_merge(): both += self._pairs(formats, duration)
+        pool = both or [f for f in formats if f.get('url')]
+        if not pool: return None, name, 'no downloadable formats'
+        limits = [] if self.can_merge() else ['muxed only (no ffmpeg)']
+        max_h = prof.get('max_height')
+        if max_h: limits.append(f'height<={max_h}')
+        cap = prof.get('target_kbps') or 0
+        if prof.get('adaptive'):
+            bps = adaptive_tuner.throughput(url)
+            if bps:
+                cap = min(cap, bps * 8 / 1000) if cap else bps * 8 / 1000
+                limits.append(f'throughput {human_size(bps)}/s')
+        if cap: limits.append(f'<= {cap:.0f} kbps')
+        try:
+            import shutil
+            free = shutil.disk_usage(VIDEO_DIR).free - self.DISK_RESERVE
+        except Exception:
+            free = None
+        if free is not None: limits.append(f'free {human_size(max(free, 0))}')
+
+        def fits(f):
+            if max_h and (f.get('height') or 0) > max_h: return False
+            if cap and self._kbps(f, duration) > cap: return False
+            if free is not None and self._size(f, duration) > free: return False
+            return True
+
+        # at equal height a muxed stream wins over a pair that needs merging
+        rank = lambda f: ((f.get('height') or 0), not f.get('requested_formats'), self._kbps(f, duration))
+        ok = [f for f in pool if fits(f)]
+        if ok:
+            return max(ok, key=rank), name, ', '.join(limits)
+        # nothing satisfies the profile: fall back to the smallest stream available
+        smallest = min(pool, key=lambda f: (self._size(f, duration) or float('inf'), rank(f)))
+        return smallest, name, 'no format within ' + (', '.join(limits) or 'limits') + '; smallest chosen'
+
+    def for_job(self, job):
+        """yt-dlp 'format' option for job: a raw spec string or a selector callable recording its choice."""
+        prof = self.profiles()[self.profile_name()]
+        if prof.get('format'):
+            job.format_choice = {'profile': self.profile_name(), 'spec': prof['format']}
+            return prof['format']
+        def select(ctx):
+            f, name, reason = self.choose(ctx.get('formats') or [], job.url, job.duration)
+            if f is None: return
+            job.format_choice = {'profile': name, 'format_id': f.get('format_id'), 'height': f.get('height'),
+                                 'tbr': f.get('tbr'), 'ext': f.get('ext'), 'size': self._size(f, job.duration),
+                                 'reason': reason}
+            job.format_id = f.get('format_id')
+            yield f
+        return select
+
+    def estimate_size(self, info, job, profile_pick=True):
+        """Expected bytes for info: the profile's pick among its formats, else what yt-dlp selected."""
+        duration = info.get('duration') or job.duration
+        if profile_pick and info.get('formats'):
+            f, _, _ = self.choose(info['formats'], job.url, duration)
+            if f is not None: return self._size(f, duration)
+        return sum(self._size(f, duration) for f in (info.get('requested_formats') or [info]))
+
+format_selector = FormatSelector()
+
+def entry_files(entry):
+    """Every file on disk that belongs to a library entry: the video, leftover partials, local thumbnails."""
+    path = entry.get('path')
+    if not path: return []
+    files = [path, path + '.part', path + '.ytdl']
+    for t in (entry.get('thumbnail') or '', str(THUMBS_DIR / (Path(path).stem + '.jpg'))):
+        if t and not t.startswith('http') and t not in files: files.append(t)
+    return files
+
+class StorageQuota:
+    """
+    Optional budget for VIDEO_DIR (config 'storage_quota_mb', 0 = unlimited). run_job calls
+    make_room() once extraction and the duplicate checks are done, before any bytes arrive;
+    it deletes the least recently played unpinned videos with their thumbnails until the
+    download fits. Never-played videos count as played on their download date. Space promised
+    to running downloads is held in _reserved until the job finishes; what their partial files
+    already occupy is counted by used(), so only the rest of each estimate stays reserved.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reserved = {}     # job id -> (job, estimated bytes still to come, bytes on disk when reserved)
+        self.playing = None     # path open in the player, never evicted
+
+    def limit(self):
+        try: return max(int(config.get('storage_quota_mb', 0) or 0), 0) * 1024**2
+        except Exception: return 0
+
+    def used(self):
+        if not storage_accountant.reconciled_at: storage_accountant.reconcile()
+        t = storage_accountant.totals()
+        return t['videos']['size'] + t['partials']['size']
+
+    def candidates(self):
+        """Evictable entries, least recently played first."""
+        pool = [e for e in library.entries() if not e.get('pinned') and e.get('path') != self.playing]
+        return sorted(pool, key=lambda e: str(e.get('last_played') or e.get('download_date') or ''))
+
+    @staticmethod
+    def _on_disk(job):
+        f = job.filename or job.tmpfilename
+        return storage_accountant.download_bytes(download_prefix(f)) if f else 0
+
+    def _outstanding(self, exclude=None):
+        return sum(max(needed - (self._on_disk(j) - base), 0)
+                   for j, needed, base in self._reserved.values() if exclude is None or j.id != exclude.id)
+
+    def make_room(self, needed, job=None):
+        """Evict until needed more bytes fit; False if even evicting every candidate is not enough."""
+        limit = self.limit()
+        if not limit: return True
+        needed = int(needed or 0)
+        with self._lock:
+            over = self.used() + self._outstanding(exclude=job) + needed - limit
+            victims = []
+            for e in self.candidates():
+                if over <= 0: break
+                victims.append(e); over -= e.get('size') or 0
+            if over > 0: return False
+            if victims: self.evict(victims)
+            if job is not None: self._reserved[job.id] = (job, needed, self._on_disk(job))
+        return True
+
+    def release(self, job):
+        with self._lock: self._reserved.pop(job.id, None)
+
+    def evict(self, entries):
+        freed = 0
+        for e in entries:
+            for f in entry_files(e):
+                try:
+                    if os.path.exists(f):
+                        if f == e.get('path'): freed += os.path.getsize(f)
+                        os.remove(f)
+                except Exception as ex:
+                    print('Error evicting', f, ex)
+                storage_accountant.forget(f)
+        library.remove_many([e.get('path') for e in entries])
+        print(f'[quota] evicted {len(entries)} video(s), {human_size(freed)} freed')
+        return freed
+
+storage_quota = StorageQuota()
+
+# the tag yt-dlp puts before the extension of per-format streams (.f137, .fhls-720p) and
+# post-processor output (.temp); plain words such as '.final' are part of a title, not a tag
+INTERMEDIATE_TAG = r'(?:f(?:\d[^./\\]*|[^./\\]*-[^./\\]*)|temp)'
+INTERMEDIATE_RE = re.compile(rf'\.{INTERMEDIATE_TAG}\.[^.]+$')   # a finished per-format stream / post-processor file
+
+def download_prefix(f):
+    """'.../Title.' for a download's final or temporary file name (.part, .fNNN and .temp stripped)."""
+    if f.endswith('.part'): f = f[:-5]
+    return re.sub(rf'\.{INTERMEDIATE_TAG}$', '', os.path.splitext(os.path.abspath(f))[0]) + '.'
+
+def active_download_prefixes(exclude=None):
+    """
+    Path prefixes ('.../Title.') covering every file an unfinished download may write: its
+    .part/.ytdl/.part-FragN files, per-format .fNNN streams and .temp post-processor output.
+    The flag is True when a running download has no file name yet, so its files cannot be
+    told apart from strays. exclude is a job key left out of the result.
+    """
+    prefixes, unknown = set(), False
+    records = [{'key': j.key, 'filename': j.filename, 'tmpfilename': j.tmpfilename, 'state': j.state}
+               for j in download_manager.jobs()]
+    for rec in records + download_journal.unfinished():
+        if exclude is not None and rec.get('key') == exclude: continue
+        f = rec.get('filename') or rec.get('tmpfilename')
+        if not f:
+            unknown = unknown or rec.get('state') == 'running'
+            continue
+        prefixes.add(download_prefix(f))
+    return prefixes, unknown
+
+class DeleteTask:
+    """One queued deletion; cancel() stops it after the batch in progress."""
+    def __init__(self, entries, sweep=False, on_progress=None, on_done=None):
+        self.entries = list(entries)
+        self.sweep = sweep              # clear-all: also remove stray files left in the folders
+        self.total = len(self.entries)
+        self.done = 0
+        self.cancelled = False
+        self.on_progress = on_progress  # on_progress(task), Kivy main thread
+        self.on_done = on_done          # on_done(task), Kivy main thread
+
+    def cancel(self):
+        self.cancelled = True
+
+class DeletionWorker:
+    """
+    Deletes library videos on a single background thread in batches of BATCH: their files
+    (video, partials, thumbnails) are unlinked, then the library and store are updated once
+    per batch. Progress and completion are reported on the Kivy main thread.
+    """
+    BATCH = 32
+
+    def __init__(self):
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='delete')
+            return self._pool
+
+    def delete(self, entries, **callbacks):
+        task = DeleteTask(entries, **callbacks)
+        self._executor().submit(self._run, task)
+        return task
+
+    def clear_all(self, **callbacks):
+        task = DeleteTask(library.entries(), sweep=True, **callbacks)
+        self._executor().submit(self._run, task)
+        return task
+
+    def _run(self, task):
+        try:
+            for i in range(0, task.total, self.BATCH):
+                if task.cancelled: break
+                batch = task.entries[i:i + self.BATCH]
+                for e in batch:
+                    for f in entry_files(e):
+                        try: os.remove(f)
+                        except FileNotFoundError: pass
+                        except Exception as ex: print('Error deleting', f, ex)
+                        storage_accountant.forget(f)
+                library.remove_many([e.get('path') for e in batch])
+                task.done += len(batch)
+                self._report(task.on_progress, task)
+            if task.sweep and not task.cancelled:
+                self._sweep()
+        except Exception:
+            traceback.print_exc()
+        self._report(task.on_done, task)
+
+    def _sweep(self):
+        # orphans not in the library: partials of finished/cancelled jobs, stray thumbnails
+        prefixes, unknown = active_download_prefixes()
+        dirs = (VIDEO_DIR, THUMBS_DIR)
+        if unknown:
+            # a running download has not reported its file name yet; leave its folder alone
+            print('Clear all: download in progress, VIDEO_DIR not swept')
+            dirs = (THUMBS_DIR,)
+        for d in dirs:
+            try:
+                with os.scandir(d) as it:
+                    for de in it:
+                        # dotfiles hold app state (e.g. the thumbnailer's .nothumb.json), not media
+                        if de.name.startswith('.'): continue
+                        if de.is_file(follow_symlinks=False) and not os.path.abspath(de.path).startswith(tuple(prefixes)):
+                            try: os.remove(de.path)
+                            except Exception as ex: print('Error deleting', de.path, ex)
+            except FileNotFoundError:
+                pass
+        storage_accountant.reconcile()
+
+    @mainthread
+    def _report(self, callback, task):
+        if callback:
+            try: callback(task)
+            except Exception: traceback.print_exc()
+
+deletion_worker = DeletionWorker()
+
+class LibraryReconciler:
+    """
+    Brings the library and the folders back in line: entries whose file is gone are dropped,
+    videos copied into VIDEO_DIR by hand are added, and stray partial downloads and thumbnails
+    are deleted. Folder listings are cached in scan_index.json with each directory's mtime, so
+    an unchanged directory is not listed again; the comparison itself is in memory.
+    Files of unfinished downloads and anything younger than GRACE seconds are left alone in
+    case they are still being written.
+    """
+    GRACE = 600
+
+    def __init__(self, index_file):
+        self.index_file = Path(index_file)
+        self._lock = threading.Lock()
+        self._running = False
+        self._index = None          # {'dirs': {dir: mtime_ns}, 'files': {dir: {name: [size, mtime]}}}
+        self.last_report = None
+
+    def _load_index(self):
+        if self._index is None:
+            try: self._index = json.loads(self.index_file.read_text(encoding='utf-8'))
+            except Exception: self._index = {}
+            self._index.setdefault('dirs', {}); self._index.setdefault('files', {})
+        return self._index
+
+    def _save_index(self):
+        try:
+            tmp = self.index_file.with_name(self.index_file.name + '.tmp')
+            tmp.write_text(json.dumps(self._index, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp, self.index_file)
+        except Exception as e:
+            print('Error saving scan index:', e)
+
+    def _listing(self, d, force):
+        """{name: [size, mtime]} for d, re-listed only when its mtime moved; returns (listing, rescanned)."""
+        index = self._load_index(); key = str(d)
+        try: mtime = os.stat(d).st_mtime_ns
+        except FileNotFoundError: return {}, False
+        if not force and index['dirs'].get(key) == mtime and key in index['files']:
+            return index['files'][key], False
+        files = {}
+        with os.scandir(d) as it:
+            for de in it:
+                if de.name.startswith('.') or not de.is_file(follow_symlinks=False): continue
+                try:
+                    st = de.stat(follow_symlinks=False)
+                    files[de.name] = [st.st_size, st.st_mtime]
+                except OSError: pass
+        index['dirs'][key] = mtime; index['files'][key] = files
+        return files, True
+
+    def run_async(self, force=False, on_done=None):
+        with self._lock:
+            if self._running: return False
+            self._running = True
+        threading.Thread(target=self._run, args=(force, on_done), daemon=True).start()
+        return True
+
+    def _run(self, force, on_done):
+        try:
+            report = self.reconcile(force)
+            if on_done: Clock.schedule_once(lambda dt: on_done(report), 0)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self._lock: self._running = False
+
+    def reconcile(self, force=False, fix=True):
+        t0 = time.perf_counter()
+        # entries first: a download finishing during the listing is then at worst seen as untracked
+        entries = library.entries()
+        videos, rescanned_v = self._listing(VIDEO_DIR, force)
+        thumbs, rescanned_t = self._listing(THUMBS_DIR, force)
+        vdir = os.path.abspath(VIDEO_DIR)
+        now = time.time()
+        tracked = {os.path.abspath(e.get('path') or '') for e in entries}
+
+        missing = []
+        for e in entries:
+            p = os.path.abspath(e.get('path') or '')
+            present = os.path.basename(p) in videos if os.path.dirname(p) == vdir else os.path.exists(p)
+            if not present: missing.append(e)
+
+        # files of unfinished downloads, and anything just written, may still be in flux
+        prefixes = tuple(active_download_prefixes()[0])
+        untracked, orphans = [], []
+        for name, (size, mtime) in videos.items():
+            p = os.path.join(vdir, name)
+            if p.startswith(prefixes) or now - mtime <= self.GRACE: continue
+            if storage_accountant.classify(p) == 'partials':
+                orphans.append(p)
+            elif (os.path.splitext(name)[1].lower() in VIDEO_EXTS and p not in tracked
+                  and not INTERMEDIATE_RE.search(name)):
+                untracked.append((p, size, mtime))
+        stems = {os.path.splitext(n)[0] for n in videos}
+        referenced = {os.path.abspath(e['thumbnail']) for e in entries if e.get('thumbnail') and not e['thumbnail'].startswith('http')}
+        for name, (size, mtime) in thumbs.items():
+            p = os.path.join(os.path.abspath(THUMBS_DIR), name)
+            if os.path.splitext(name)[0] not in stems and p not in referenced and now - mtime > self.GRACE:
+                orphans.append(p)
+
+        report = {'missing': len(missing), 'untracked': len(untracked), 'orphans': len(orphans),
+                  'rescanned': int(rescanned_v) + int(rescanned_t)}
+        if fix:
+            # re-checked against the live state, which may have moved since the snapshot
+            missing = [e for e in missing if not os.path.exists(e.get('path') or '')]
+            if missing:
+                library.remove_many([e.get('path') for e in missing])
+            untracked = [u for u in untracked if library.get(u[0]) is None]
+            report.update(missing=len(missing), untracked=len(untracked))
+            for p, size, mtime in untracked:
+                library.add({'title': os.path.splitext(os.path.basename(p))[0], 'path': p, 'url': '',
+                             'duration': 0, 'thumbnail': '', 'size': size, 'platform': 'Local',
+                             'download_date': datetime.fromtimestamp(mtime).isoformat()})
+            for p in orphans:
+                try: os.remove(p)
+                except Exception as ex: print('Error removing', p, ex)
+                storage_accountant.forget(p)
+            if untracked: local_thumbnailer.scan_library()
+            if untracked or orphans:
+                # our own changes moved the directory mtimes; list them again next time
+                self._index['dirs'].clear()
+        self._save_index()
+        report['seconds'] = round(time.perf_counter() - t0, 3)
+        self.last_report = report
+        print('[reconcile]', ', '.join(f'{k}={v}' for k, v in report.items()))
+        return report
+
+library_reconciler = LibraryReconciler(SCAN_INDEX_FILE)
+
+class DownloadJob:
+    """One queued download. Fields are written by the worker thread and read by the UI."""
+    _ids = itertools.count(1)
+
+    def __init__(self, url, priority=0, listener=None, complete_callback=None, error_callback=None, title=''):
+        self.id = next(DownloadJob._ids)
+        self.key = uuid.uuid4().hex[:16]  # stable across restarts (journal key)
+        self.url = url
+        self.priority = priority
+        self.title = title
+        self.state = 'queued'   # queued, running, paused, cancelled, done, error
+        self.percent = 0.0
+        self.downloaded = 0
+        self.total = 0
+        self.speed = 0.0        # smoothed bytes/s, maintained by ProgressAggregator
+        self.eta = None
+        self.error = ''
+        self.entry = None
+        self.tmpfilename = None
+        self.filename = None
+        self.format_id = None   # pinned on resume so yt-dlp continues the same .part file
+        self.timings = {}       # phase -> seconds (extract, download, finalize)
+        self.stats = {}         # fragment/chunk settings and error counts used for this download
+        self.duration = 0
+        self.format_choice = None  # what FormatSelector picked and why
+        self.duplicate = False     # answered from the library without downloading
+        self.info = None           # extraction handed over by BatchIngestor, used once by run_job
+        self.info_expires = 0
+        self.listener = listener
+        self.complete_callback = complete_callback
+        self.error_callback = error_callback
+        self._abort = None      # 'pause' / 'cancel' requested while running
+        self._token = None      # heap entry that is still valid for this job
+
+    def notify(self):
+        # listeners get batched calls listener([job, ...]) on the main thread via progress_aggregator
+        download_journal.track(self)
+        progress_aggregator.mark(self)
+
+class DownloadManager:
+    """Priority queue of DownloadJob served by a bounded pool of worker threads."""
+    def __init__(self, workers=2):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._jobs = {}
+        self._workers = max(1, int(workers))
+        self._alive = 0
+        self.dequeue_callbacks = []  # called (no arguments, no lock held) when a job leaves the queue
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs.values())
+
+    def submit(self, url, priority=0, listener=None, complete_callback=None, error_callback=None, title='', info=None):
+        job = DownloadJob(url, priority, listener, complete_callback, error_callback, title)
+        if info is not None:
+            job.info, job.info_expires = info, extraction_cache.expires(info)
+        return self.submit_job(job)
+
+    def submit_job(self, job, paused=False):
+        with self._cond:
+            self._jobs[job.id] = job
+            if paused:
+                job.state = 'paused'
+            else:
+                job.state = 'queued'
+                self._push(job)
+                self._ensure_workers()
+                self._cond.notify()
+        job.notify()
+        return job
+
+    def restore(self, records, listener=None, complete_callback=None, error_callback=None):
+        """Re-queue jobs from DownloadJournal.unfinished(); yt-dlp continues from their .part files."""
+        jobs = []
+        for r in records:
+            job = DownloadJob(r['url'], r.get('priority', 0), listener, complete_callback, error_callback, r.get('title', ''))
+            job.key = r['key']
+            job.format_id = r.get('format'); job.filename = r.get('filename'); job.tmpfilename = r.get('tmpfilename')
+            job.downloaded = r.get('downloaded', 0); job.total = r.get('total', 0)
+            job.percent = (job.downloaded / job.total * 100) if job.total else 0.0
+            if job.tmpfilename and os.path.exists(job.tmpfilename):
+                print(f"[journal] resuming {job.url} from {human_size(os.path.getsize(job.tmpfilename))}")
+            jobs.append(self.submit_job(job, paused=r.get('state') == 'paused'))
+        return jobs
+
+    def set_priority(self, job, priority):
+        with self._cond:
+            job.priority = priority
+            if job.state == 'queued':
+                self._push(job); self._cond.notify()
+
+    def cancel(self, job):
+        with self._cond:
+            if job.state in ('queued', 'paused'):
+                job.state = 'cancelled'; job._token = None
+                self._jobs.pop(job.id, None)
+            elif job.state == 'running':
+                job._abort = 'cancel'; return
+            else:
+                return
+        self._remove_partials(job)
+        job.notify()
+        self._dequeued()
+
+    def pause(self, job):
+        with self._cond:
+            if job.state == 'queued':
+                job.state = 'paused'; job._token = None
+            elif job.state == 'running':
+                # the progress hook aborts the transfer, the .part file is kept for resume
+                job._abort = 'pause'; return
+            else:
+                return
+        job.notify()
+        self._dequeued()
+
+    def resume(self, job):
+        with self._cond:
+            if job.state != 'paused':
+                return
+            job.state = 'queued'; job._abort = None
+            self._push(job); self._ensure_workers(); self._cond.notify()
+        job.notify()
+
+    def _push(self, job):
+        job._token = next(self._seq)
+        heapq.heappush(self._heap, (-job.priority, job._token, job))
+
+    def _dequeued(self):
+        for callback in list(self.dequeue_callbacks):
+            try: callback()
+            except Exception: traceback.print_exc()
+
+    def _ensure_workers(self):
+        while self._alive < self._workers:
+            self._alive += 1
+            threading.Thread(target=self._loop, daemon=True).start()
+
+    def _next_job(self):
+        # called with the lock held; skips heap entries made stale by pause/cancel/re-prioritise
+        while self._heap:
+            _, token, job = heapq.heappop(self._heap)
+            if job.state == 'queued' and job._token == token:
+                return job
+        return None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                job = None
+                while job is None:
+                    job = self._next_job()
+                    if job is None: self._cond.wait()
+                job.state = 'running'; job._token = None
+            job.notify()
+            self._dequeued()
+            try:
+                VideoDownloader.run_job(job)
+            except Exception:
+                traceback.print_exc()
+            self._finish(job)
+
+    def _finish(self, job):
+        with self._cond:
+            if job._abort == 'pause':
+                job.state = 'paused'
+                storage_accountant.note(job.tmpfilename)
+            elif job._abort == 'cancel':
+                job.state = 'cancelled'
+            elif job.state == 'running':
+                job.state = 'done' if job.entry else 'error'
+            job._abort = None
+            if job.state in ('done', 'error', 'cancelled'):
+                self._jobs.pop(job.id, None)
+        if job.state == 'cancelled':
+            self._remove_partials(job)
+        storage_quota.release(job)
+        job.notify()
+
+    # what may follow '<stem>.' in a cancelled job's leftovers: [fID.|temp.]ext plus .part,
+    # .part-FragN, .ytdl or .part.ytdl, or a finished fID.ext/temp.ext stream of an unmerged download
+    LEFTOVER = re.compile(rf'(?:{INTERMEDIATE_TAG}\.)?\w+(?:\.part(?:-Frag\d+)?(?:\.part)?|(?:\.part)?\.ytdl)'
+                          rf'|{INTERMEDIATE_TAG}\.\w+')
+
+    def _remove_partials(self, job):
+        """Delete the files a cancelled job left behind; other downloads' files and library videos are kept."""
+        f = job.filename or job.tmpfilename
+        if not f:
+            return
+        prefix = download_prefix(f)
+        others = tuple(active_download_prefixes(exclude=job.key)[0])
+        folder = os.path.dirname(prefix)
+        try:
+            names = os.listdir(folder)
+        except Exception:
+            return
+        for name in names:
+            path = os.path.join(folder, name)
+            if (not path.startswith(prefix) or not self.LEFTOVER.fullmatch(path[len(prefix):])
+                    or path.startswith(others) or library.get(path)):
+                continue
+            try:
+                os.remove(path)
+            except Exception as e:
+                print('Error removing', path, e)
+            storage_accountant.forget(path)
+
 class VideoDownloader:
     @staticmethod
-    def download_video(url, progress_callback=None, complete_callback=None, error_callback=None):
+    def base_opts():
+        outtmpl = str(VIDEO_DIR / "%(title).200s.%(ext)s")
+        return {
+            'outtmpl': outtmpl,
+            'format': 'best[height<=720]/best',
+            'quiet': True,
+            'noplaylist': True,
+            'no_warnings': True,
+            'ignoreerrors': True,
+            'extract_flat': False,
+            'http_headers': {
+                'User-Agent': 'Mozilla/5.0'
+            },
+            'socket_timeout': 30,
+            'retries': 3,
+            'fragment_retries': 3,
+            'skip_unavailable_fragments': True,
+            # إضافة logger الآمن هنا لتجنب مشكلة "str object has no attribute write"
+            'logger': _YTDLPLogger(),
+        }
+
+    @staticmethod
+    def _output_file(ydl, info, outputs, finished):
+        """Final merged/remuxed file as reported by yt-dlp's hooks, most specific source first."""
+        candidates = [outputs.get('final'), outputs.get('postprocessed')]
+        candidates += [d.get('filepath') for d in reversed(info.get('requested_downloads') or [])]
+        candidates += [info.get('filepath')] + list(reversed(finished))
+        try: candidates.append(ydl.prepare_filename(info))
+        except Exception: pass
+        for c in candidates:
+            if c and os.path.exists(c): return str(c)
+        return None
+
+    @staticmethod
+    def run_job(job):
+        url = job.url
+        error_callback = job.error_callback
+        complete_callback = job.complete_callback
+        finished = []
+        logger = _JobLogger()
+        yt_dlp = load_yt_dlp()
+        file_start = {}   # filename -> (monotonic start, fragment errors at start)
+        holder = {}       # the running YoutubeDL, so the hook can re-tune params between files
+
+        def observe(d):
+            start = file_start.pop(d.get('filename'), None)
+            size = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+            if not start or not size: return
+            elapsed = d.get('elapsed') or (time.monotonic() - start[0])
+            errors = (logger.fragment_errors + logger.skipped_fragments) - start[1]
+            if elapsed <= 0: return
+            settings = adaptive_tuner.observe(url, size / elapsed, errors, job.stats.get('fragmented', False))
+            if holder.get('ydl'): adaptive_tuner.apply(holder['ydl'].params, settings)
+            job.stats.update({'throughput': round(size / elapsed), 'fragment_errors': logger.fragment_errors,
+                              'skipped_fragments': logger.skipped_fragments})
+
+        outputs = {}      # exact paths reported by yt-dlp: 'final' (post_hooks), 'postprocessed'
+        hasher = _StreamHasher() if config.get('content_hash') else None
+        HASH_STEP = 4 * 1024**2
+
+        def post_hook(filepath):
+            outputs['final'] = filepath
+
+        def postprocessor_hook(d):
+            if d.get('status') == 'finished':
+                fp = (d.get('info_dict') or {}).get('filepath')
+                if fp: outputs['postprocessed'] = fp
+
         def progress_hook(d):
+            if job._abort:
+                raise yt_dlp.utils.DownloadCancelled(job._abort)
             try:
                 status = d.get('status')
+                job.tmpfilename = d.get('tmpfilename') or job.tmpfilename
                 if status == 'downloading':
+                    if d.get('filename') not in file_start:
+                        file_start[d.get('filename')] = (time.monotonic(), logger.fragment_errors + logger.skipped_fragments)
+                    if d.get('fragment_count'): job.stats['fragmented'] = True
                     total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
                     downloaded = d.get('downloaded_bytes', 0)
-                    percent = (downloaded/total*100) if total else 0.0
-                    if progress_callback: progress_callback(percent, downloaded, total)
+                    job.percent = (downloaded/total*100) if total else 0.0
+                    job.downloaded, job.total = downloaded, total
+                    if hasher and d.get('tmpfilename') and (d['tmpfilename'] != hasher.path or downloaded - hasher.offset >= HASH_STEP):
+                        hasher.feed(d['tmpfilename'])
+                    job.notify()
                 elif status == 'finished':
-                    if progress_callback: progress_callback(100, d.get('total_bytes',0), d.get('total_bytes',0))
+                    if hasher: hasher.renamed(d.get('tmpfilename'), d.get('filename'))
+                    finished.append(d.get('filename'))
+                    observe(d)
+                    job.percent = 100; job.downloaded = job.total = d.get('total_bytes', 0)
+                    job.notify()
             except Exception:
                 pass
 
-        def worker():
-            if yt_dlp is None:
-                if error_callback: error_callback('yt-dlp not installed. Run: pip install yt-dlp')
-                return
-            try:
-                outtmpl = str(VIDEO_DIR / "%(title).200s.%(ext)s")
-                opts = {
-                    'outtmpl': outtmpl,
-                    'format': 'best[height<=720]/best',
-                    'progress_hooks': [progress_hook],
-                    'quiet': True,
-                    'noplaylist': True,
-                    'no_warnings': True,
-                    'ignoreerrors': True,
-                    'extract_flat': False,
-                    'http_headers': {
-                        'User-Agent': 'Mozilla/5.0'
-                    },
-                    'socket_timeout': 30,
-                    'retries': 3,
-                    'fragment_retries': 3,
-                    'skip_unavailable_fragments': True,
-                    # إضافة logger الآمن هنا لتجنب مشكلة "str object has no attribute write"
-                    'logger': _YTDLPLogger(),
-                }
-                with yt_dlp.YoutubeDL(opts) as ydl:
+        def fail(msg):
+            job.state = 'error'; job.error = msg
+            if error_callback: error_callback(msg)
+
+        def duplicate(existing):
+            job.title = existing.get('title') or job.title
+            job.duplicate = True; job.percent = 100; job.entry = existing
+            print('[download] already in library:', url, '->', existing.get('path'))
+            if complete_callback: complete_callback(dict(existing, duplicate=True))
+
+        # repeats are answered from the library before any network transfer
+        existing = dedupe_index.find(url=url, extractor_id=extractor_temp_id(url))
+        if existing:
+            duplicate(existing); return
+
+        if yt_dlp is None:
+            fail('yt-dlp not installed. Run: pip install yt-dlp'); return
+        try:
+            opts = VideoDownloader.base_opts()
+            opts['progress_hooks'] = [progress_hook]
+            opts['postprocessor_hooks'] = [postprocessor_hook]
+            opts['post_hooks'] = [post_hook]
+            opts['logger'] = logger
+            settings = adaptive_tuner.settings(url)
+            adaptive_tuner.apply(opts, settings)
+            if adaptive_tuner.enabled: job.stats.update(settings)
+            if job.format_id:
+                # resumed job: keep the same format so the existing .part file is continued
+                opts['format'] = f"{job.format_id}/{opts['format']}"
+            else:
+                opts['format'] = format_selector.for_job(job)
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                holder['ydl'] = ydl
+                def extract():
                     info = ydl.extract_info(url, download=False)
+                    if info: extraction_cache.put(url, ydl.sanitize_info(info))
+                    return info
+
+                t0 = time.perf_counter()
+                # a batch-resolved job brings its extraction along; the cache covers the rest
+                info = job.info if job.info is not None and job.info_expires > time.time() else None
+                job.info = None
+                if info is None: info = extraction_cache.get(url)
+                cache_hit = info is not None
+                if not cache_hit:
+                    info = extract()
+                job.timings['extract'] = time.perf_counter() - t0
+                if not info:
+                    fail('Unable to extract video information'); return
+                extractor_id = f"{info.get('extractor_key')}:{info.get('id')}" if info.get('id') else None
+                existing = dedupe_index.find(extractor_id=extractor_id)
+                if existing:
+                    duplicate(existing); return
+                job.title = info.get('title', '') or job.title
+                job.duration = info.get('duration') or 0
+                # storage limit: make room only for a download that will really happen, before it starts
+                size = format_selector.estimate_size(info, job, profile_pick=not isinstance(opts['format'], str))
+                if job.tmpfilename and os.path.exists(job.tmpfilename):
+                    size = max(size - os.path.getsize(job.tmpfilename), 0)
+                if not storage_quota.make_room(size, job):
+                    fail('Storage limit reached: not enough unpinned videos to remove'); return
+                job.format_id = job.format_id or info.get('format_id')
+                try: job.filename = ydl.prepare_filename(info)
+                except Exception: pass
+                job.notify()
+                # reuse the extracted info for the download instead of running the extractor again
+                t0 = time.perf_counter()
+                result = ydl.process_ie_result(info, download=True)
+                if cache_hit and not finished and not job._abort:
+                    # cached format URLs were rejected (expired/revoked): extract fresh and retry once
+                    print('[download] cached extraction failed, re-extracting', url)
+                    extraction_cache.invalidate(url)
+                    info = extract()
                     if not info:
-                        if error_callback: error_callback('Unable to extract video information'); return
-                    info = ydl.extract_info(url, download=True)
-                    try:
-                        fname = ydl.prepare_filename(info)
-                    except Exception:
-                        fname = None
-                    video_file = fname if fname and os.path.exists(fname) else None
-                    if not video_file:
-                        title = info.get('title','')
-                        for f in VIDEO_DIR.iterdir():
-                            if title and title[:30] in f.name:
-                                video_file = str(f); break
-                    if video_file:
-                        thumb_url = info.get('thumbnail',''); thumb_local = ''
+                        fail('Unable to extract video information'); return
+                    result = ydl.process_ie_result(info, download=True)
+                info = result or info
+                job.timings['download'] = time.perf_counter() - t0
+                if job._abort: return
+                t0 = time.perf_counter()
+                video_file = VideoDownloader._output_file(ydl, info, outputs, finished)
+                sha256 = hasher.digest(video_file) if hasher and video_file else None
+                if sha256:
+                    existing = dedupe_index.find(sha256=sha256)
+                    if existing and os.path.abspath(existing['path']) != os.path.abspath(video_file):
+                        # identical bytes already in the library: keep one copy on disk
+                        try: os.remove(video_file)
+                        except Exception: pass
+                        storage_accountant.forget(video_file)
+                        duplicate(existing); return
+                if video_file:
+                    thumb_url = info.get('thumbnail','')
+                    thumb_local = str(THUMBS_DIR / (Path(video_file).stem + '.jpg'))
+                    if not os.path.exists(thumb_local): thumb_local = ''
+                    entry = {
+                        'title': info.get('title','Video'),
+                        'path': str(video_file),
+                        'url': url,
+                        'duration': info.get('duration',0),
+                        'thumbnail': thumb_local or info.get('thumbnail',''),
+                        'download_date': datetime.now().isoformat(),
+                        'size': os.path.getsize(video_file) if os.path.exists(video_file) else 0,
+                        'platform': info.get('extractor_key', 'Unknown'),
+                        'canonical_url': canonical_url(url),
+                        'extractor_id': extractor_id,
+                    }
+                    if sha256: entry['sha256'] = sha256
+                    entry['format'] = job.format_choice or {'format_id': info.get('format_id'), 'reason': 'resumed download'}
+                    job.timings['finalize'] = time.perf_counter() - t0
+                    entry['timings'] = {k: round(v, 3) for k, v in job.timings.items()}
+                    if job.stats: entry['stats'] = dict(job.stats)
+                    entry = library.add(entry)
+                    storage_accountant.note(video_file)
+                    if job.tmpfilename: storage_accountant.forget(job.tmpfilename)
+                    if not thumb_local:
+                        ready = lambda p, e=entry: _thumbnail_ready(e, p)
+                        from_frame = lambda f=video_file, d=entry['duration'], r=ready: local_thumbnailer.submit(f, d, on_ready=r)
                         if thumb_url:
-                            try:
-                                ext = os.path.splitext(thumb_url)[1].split('?')[0] or '.jpg'
-                                thumb_local = str(THUMBS_DIR / (Path(video_file).stem + ext))
-                                if not os.path.exists(thumb_local):
-                                    download_thumbnail(thumb_url, thumb_local)
-                            except Exception:
-                                thumb_local = ''
-                        entry = {
-                            'title': info.get('title','Video'),
-                            'path': str(video_file),
-                            'url': url,
-                            'duration': info.get('duration',0),
-                            'thumbnail': thumb_local or info.get('thumbnail',''),
-                            'download_date': datetime.now().isoformat(),
-                            'size': os.path.getsize(video_file) if os.path.exists(video_file) else 0,
-                            'platform': info.get('extractor_key', 'Unknown'),
-                        }
-                        video_database.append(entry)
-                        save_db(video_database)
-                        if complete_callback: complete_callback(entry)
-                    else:
-                        if error_callback: error_callback('File not found after download')
-            except Exception as e:
-                error_msg = str(e)
-                if 'Unsupported URL' in error_msg:
-                    error_msg = 'Platform not supported or invalid URL'
-                elif 'Private video' in error_msg:
-                    error_msg = 'Video is private or unavailable'
-                elif 'Video unavailable' in error_msg:
-                    error_msg = 'Video is no longer available'
-                if error_callback: error_callback(error_msg)
+                            # the entry shows the remote thumbnail until the local copy is ready
+                            dest = THUMBS_DIR / (Path(video_file).stem + '.jpg')
+                            thumbnail_ingestor.submit(thumb_url, dest, on_ready=ready, on_failed=from_frame)
+                        else:
+                            from_frame()
+                    print('[download] timings:', ', '.join(f"{k}={v:.2f}s" for k, v in job.timings.items()),
+                          '(cached extraction)' if cache_hit else '', url)
+                    cs = extraction_cache.stats()
+                    print(f"[extract-cache] hits={cs['hits']} misses={cs['misses']} entries={cs['entries']} size={human_size(cs['bytes'])}")
+                    job.entry = entry
+                    if complete_callback: complete_callback(entry)
+                else:
+                    fail('File not found after download')
+        except Exception as e:
+            if job._abort: return
+            error_msg = str(e)
+            if 'Unsupported URL' in error_msg:
+                error_msg = 'Platform not supported or invalid URL'
+            elif 'Private video' in error_msg:
+                error_msg = 'Video is private or unavailable'
+            elif 'Video unavailable' in error_msg:
+                error_msg = 'Video is no longer available'
+            fail(error_msg)
+
+download_manager = DownloadManager(config.get('max_downloads', 2))
+
+class BatchIngestor:
+    """
+    Resolves a playlist URL or a pasted list of URLs on a bounded pool of extractor threads.
+    Each resolved video is handed to download_manager together with its extraction, so the
+    first download starts while later entries are still being extracted. Resolution stays at
+    most `lookahead` videos ahead of the download queue; playlist entries already in the
+    library are submitted without extracting them (run_job answers them from the library).
+    """
+    URL_RE = re.compile(r'https?://\S+')
+
+    def __init__(self, workers=4, lookahead=6):
+        self.workers = max(1, int(workers))
+        self.lookahead = max(self.workers, int(lookahead))
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = collections.deque()  # (url, is playlist entry, submit_kwargs) waiting for a slot
+        self._resolving = 0
+        download_manager.dequeue_callbacks.append(self._pump)
+
+    @classmethod
+    def split_urls(cls, text):
+        seen = set(); urls = []
+        for u in cls.URL_RE.findall(text or ''):
+            if u not in seen:
+                seen.add(u); urls.append(u)
+        return urls
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hefed-extract')
+            return self._pool
+
+    def ingest(self, text, **submit_kwargs):
+        """Queue every URL in text for resolution; returns how many top-level URLs were found."""
+        urls = self.split_urls(text)
+        with self._lock:
+            self._pending.extend((u, False, submit_kwargs) for u in urls)
+        self._pump()
+        return len(urls)
+
+    def _pump(self):
+        # resolved videos waiting in the download queue and extractions in flight share the lookahead
+        ahead = sum(1 for j in download_manager.jobs() if j.state == 'queued' and j.info is not None)
+        batch = []
+        with self._lock:
+            while self._pending and self._resolving + ahead < self.lookahead:
+                batch.append(self._pending.popleft()); self._resolving += 1
+        for item in batch:
+            self._executor().submit(self._run, *item)
+
+    def _run(self, url, is_entry, submit_kwargs):
+        try:
+            self._resolve(url, is_entry, submit_kwargs)
+        finally:
+            with self._lock: self._resolving -= 1
+            self._pump()
+
+    def _resolve(self, url, is_entry, submit_kwargs):
+        error_callback = submit_kwargs.get('error_callback')
+        if is_entry and dedupe_index.find(url=url, extractor_id=extractor_temp_id(url)):
+            download_manager.submit(url, **submit_kwargs); return
+        yt_dlp = load_yt_dlp()
+        if yt_dlp is None:
+            if error_callback: error_callback('yt-dlp not installed. Run: pip install yt-dlp')
+            return
+        try:
+            opts = VideoDownloader.base_opts()
+            # playlists are listed flat; their entries come back through _resolve individually
+            opts.update({'noplaylist': False, 'extract_flat': 'in_playlist'})
+            with yt_dlp.YoutubeDL(opts) as ydl:
+                info = ydl.extract_info(url, download=False)
+                if info and info.get('_type') not in ('playlist', 'multi_video'):
+                    info = ydl.sanitize_info(info)
+            if not info:
+                if error_callback: error_callback(f'Unable to extract video information: {url}')
+                return
+            if info.get('_type') in ('playlist', 'multi_video'):
+                entries = [(e or {}).get('url') or (e or {}).get('webpage_url') for e in info.get('entries') or []]
+                with self._lock:
+                    self._pending.extend((u, True, submit_kwargs) for u in entries if u)
+                return
+            download_manager.submit(url, title=info.get('title', ''), info=info, **submit_kwargs)
+        except Exception as e:
+            if error_callback: error_callback(str(e))
 
-        threading.Thread(target=worker, daemon=True).start()
+batch_ingestor = BatchIngestor(config.get('batch_extract_workers', 4), config.get('batch_lookahead', 6))
+download_journal = DownloadJournal(JOURNAL_FILE)
+progress_aggregator = ProgressAggregator(config.get('progress_fps', 8))
+adaptive_tuner = AdaptiveTuner(config.get('max_fragment_concurrency', 8), config.get('adaptive_fragments', True))
 
 # ------------------ باقي واجهات المستخدم كما في الأصل ------------------
 
-class VideoCard(MDCard):
-    def __init__(self, video_info, on_play=None, on_delete=None, **kwargs):
+class VideoCard(RecycleDataViewBehavior, MDCard):
+    """
+    Library row recycled by VideosScreen's RecycleView: the widgets are built once and
+    refresh_view_attrs() rebinds them to whichever entry scrolls into the slot.
+    """
+    def __init__(self, video_info=None, on_play=None, on_delete=None, on_pin=None, **kwargs):
         super().__init__(**kwargs)
-        self.video_info = video_info
+        self.video_info = video_info or {}
         self.on_play = on_play
         self.on_delete = on_delete
+        self.on_pin = on_pin
         self.size_hint_y = None
         self.height = dp(120)
         self.padding = dp(8)
         self.elevation = 4
 
         layout = MDBoxLayout(orientation='horizontal', spacing=dp(10), padding=dp(8))
-        thumb_src = video_info.get('thumbnail','')
-        if thumb_src:
-            thumb_widget = AsyncImage(source=thumb_src, size_hint=(None,1), width=dp(120))
-        else:
-            thumb_widget = MDCard(size_hint=(None,1), width=dp(120))
-            thumb_widget.add_widget(MDLabel(text='🎬', halign='center', valign='middle', font_size='40sp'))
+        # placeholder and image share the slot; only one of them is visible
+        thumb_box = FloatLayout(size_hint=(None,1), width=dp(120))
+        self.thumb_placeholder = MDCard(size_hint=(1,1), pos_hint={'x': 0, 'y': 0})
+        self.thumb_placeholder.add_widget(MDLabel(text='🎬', halign='center', valign='middle', font_size='40sp'))
+        self.thumb_image = AsyncImage(size_hint=(1,1), pos_hint={'x': 0, 'y': 0})
+        thumb_box.add_widget(self.thumb_placeholder); thumb_box.add_widget(self.thumb_image)
 
         info = MDBoxLayout(orientation='vertical')
-        title_text = video_info.get('title', TRANSLATIONS['video'][LANG])
-        title = MDLabel(text=ar(title_text) if LANG=='ar' else title_text, font_style='H6', size_hint_y=None, height=dp(36))
+        title = self.title_label = MDLabel(text='', font_style='H6', size_hint_y=None, height=dp(36))
+
+        meta = self.meta_label = MDLabel(text='', font_style='Caption', size_hint_y=None, height=dp(20))
+
+        btns = MDBoxLayout(orientation='horizontal', size_hint_y=None, height=dp(36), spacing=dp(8))
+        self.play_btn = MDRaisedButton(text=tr('play'), on_release=self._play)
+        self.delete_btn = MDFlatButton(text=tr('delete'), on_release=self._delete)
+        # pinned videos are never removed by the storage limit
+        self.pin_btn = MDIconButton(icon='pin-outline', on_release=self._pin)
+        btns.add_widget(self.play_btn); btns.add_widget(self.delete_btn); btns.add_widget(self.pin_btn)
+
+        info.add_widget(title); info.add_widget(meta); info.add_widget(btns)
+        layout.add_widget(thumb_box); layout.add_widget(info)
+        self.add_widget(layout)
+        self._bind_entry()
 
+    def refresh_view_attrs(self, rv, index, data):
+        self.video_info = data.get('video_info') or {}
+        self.on_play = data.get('on_play'); self.on_delete = data.get('on_delete'); self.on_pin = data.get('on_pin')
+        self._bind_entry()
+
+    def _bind_entry(self):
+        thumb_src = self.video_info.get('thumbnail', '')
+        if self.thumb_image.source != thumb_src: self.thumb_image.source = thumb_src
+        self.thumb_image.opacity = 1 if thumb_src else 0
+        self.thumb_placeholder.opacity = 0 if thumb_src else 1
+        self.pin_btn.icon = 'pin' if self.video_info.get('pinned') else 'pin-outline'
+        self.refresh_texts()
+
+    def refresh_texts(self):
+        video_info = self.video_info
+        title_text = video_info.get('title', TRANSLATIONS['video'][LANG])
+        self.title_label.text = ar(title_text) if LANG=='ar' else title_text
         meta_text = []
         d = video_info.get('duration') or 0
         try: d_int = int(d)
@@ -367,44 +2640,92 @@ class VideoCard(MDCard):
         if platform_name: meta_text.append(platform_name)
 
         meta_txt = ' • '.join(meta_text) if meta_text else tr('video')
-        meta = MDLabel(text=ar(meta_txt) if LANG=='ar' else meta_txt, font_style='Caption', size_hint_y=None, height=dp(20))
-
-        btns = MDBoxLayout(orientation='horizontal', size_hint_y=None, height=dp(36), spacing=dp(8))
-        btns.add_widget(MDRaisedButton(text=tr('play'), on_release=self._play))
-        btns.add_widget(MDFlatButton(text=tr('delete'), on_release=self._delete))
-
-        info.add_widget(title); info.add_widget(meta); info.add_widget(btns)
-        layout.add_widget(thumb_widget); layout.add_widget(info)
-        self.add_widget(layout)
+        self.meta_label.text = ar(meta_txt) if LANG=='ar' else meta_txt
+        self.play_btn.text = tr('play'); self.delete_btn.text = tr('delete')
 
     def _play(self, inst):
         if self.on_play: self.on_play(self.video_info)
     def _delete(self, inst):
         if self.on_delete: self.on_delete(self.video_info)
+    def _pin(self, inst):
+        if self.on_pin: self.on_pin(self.video_info)
+
+class JobRow(MDCard):
+    """Progress card for a single DownloadJob in DownloadScreen's queue list."""
+    STATE_KEYS = {'queued': 'queued', 'running': 'downloading', 'paused': 'paused',
+                  'cancelled': 'cancelled', 'done': 'download_complete', 'error': 'download_failed'}
+
+    def __init__(self, job, **kwargs):
+        super().__init__(radius=[10], padding=dp(10), size_hint_y=None, height=dp(120), **kwargs)
+        self.job = job
+        pbox = MDBoxLayout(orientation='vertical', spacing=dp(6))
+        top = MDBoxLayout(orientation='horizontal', size_hint_y=None, height=dp(36))
+        self.label = MDLabel(text=tr('queued'))
+        self.pause_btn = MDIconButton(icon='pause', on_release=self._toggle_pause)
+        self.up_btn = MDIconButton(icon='arrow-up-bold', on_release=self._bump)
+        self.cancel_btn = MDIconButton(icon='close', on_release=lambda *a: download_manager.cancel(self.job))
+        top.add_widget(self.label); top.add_widget(self.up_btn); top.add_widget(self.pause_btn); top.add_widget(self.cancel_btn)
+        self.bar = MDProgressBar(value=0)
+        self.details = MDLabel(text=job.url, font_style='Caption', size_hint_y=None, height=dp(20))
+        pbox.add_widget(top); pbox.add_widget(self.bar); pbox.add_widget(self.details)
+        self.add_widget(pbox)
+
+    def update(self):
+        job = self.job
+        title = job.title or job.url
+        status = tr('already_downloaded', title='') if job.duplicate else tr(self.STATE_KEYS.get(job.state, 'queued'))
+        self.label.text = status
+        self.bar.value = job.percent
+        self.pause_btn.icon = 'play' if job.state == 'paused' else 'pause'
+        finished = job.state in ('done', 'error', 'cancelled')
+        self.pause_btn.disabled = self.cancel_btn.disabled = self.up_btn.disabled = finished
+        if job.state == 'done' and job.timings:
+            detail = ' • '.join(f"{k} {v:.1f}s" for k, v in job.timings.items())
+        elif job.total:
+            detail = f"{job.percent:.1f}% • {human_size(job.downloaded)}/{human_size(job.total)}"
+            if job.state == 'running' and job.speed:
+                detail += f" • {human_size(job.speed)}/s"
+                if job.eta is not None: detail += f" • {format_duration(job.eta)}"
+            if job.stats.get('fragmented') and job.stats.get('concurrency'):
+                detail += f" • x{job.stats['concurrency']}"
+        else:
+            detail = job.error if job.state == 'error' else ''
+        detail = f"{title[:40]} • {detail}" if detail else title[:60]
+        self.details.text = ar(detail) if LANG == 'ar' else detail
+
+    def _toggle_pause(self, inst):
+        if self.job.state == 'paused': download_manager.resume(self.job)
+        else: download_manager.pause(self.job)
+
+    def _bump(self, inst):
+        top = max([j.priority for j in download_manager.jobs()] + [0])
+        download_manager.set_priority(self.job, top + 1)
 
 class DownloadScreen(MDScreen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs); self.name='download'
         layout = MDBoxLayout(orientation='vertical', padding=dp(12), spacing=dp(12))
-        self.header_label = MDLabel(text=tr('download_videos'), font_style='H5', halign='center')
+        self.header_label = MDLabel(text=tr('download_videos'), font_style='H5', halign='center', size_hint_y=None, height=dp(48))
         layout.add_widget(self.header_label)
         card = MDCard(elevation=6, radius=[12], padding=dp(12), size_hint_y=None, height=dp(180))
         vbox = MDBoxLayout(orientation='vertical', spacing=dp(8))
-        self.url_input = MDTextField(hint_text=tr('enter_url'), multiline=False)
+        # multiline so a list of links (one per line) can be pasted for batch download
+        self.url_input = MDTextField(hint_text=tr('enter_url'), multiline=True, max_height=dp(96))
         hbox = MDBoxLayout(orientation='horizontal', size_hint_y=None, height=dp(40), spacing=dp(8))
         self.paste_btn = MDFlatButton(text=tr('paste'), on_release=self._paste)
         self.download_btn = MDRaisedButton(text=tr('download'), on_release=self._start)
-        hbox.add_widget(self.paste_btn); hbox.add_widget(self.download_btn)
+        self._batch_mode = False
+        self.batch_btn = MDIconButton(icon='playlist-plus', on_release=self._toggle_batch)
+        hbox.add_widget(self.paste_btn); hbox.add_widget(self.download_btn); hbox.add_widget(self.batch_btn)
         vbox.add_widget(self.url_input); vbox.add_widget(hbox)
         card.add_widget(vbox)
-        self.progress_card = MDCard(radius=[10], padding=dp(10), size_hint_y=None, height=dp(120), opacity=0)
-        pbox = MDBoxLayout(orientation='vertical', spacing=dp(6))
-        self.progress_label = MDLabel(text=tr('ready'), size_hint_y=None, height=dp(30))
-        self.progress_bar = MDProgressBar(value=0)
-        self.progress_details = MDLabel(text='', font_style='Caption', size_hint_y=None, height=dp(20))
-        pbox.add_widget(self.progress_label); pbox.add_widget(self.progress_bar); pbox.add_widget(self.progress_details)
-        self.progress_card.add_widget(pbox)
-        layout.add_widget(card); layout.add_widget(self.progress_card)
+        # one JobRow per queued/running download, keyed by job id
+        self._job_rows = {}
+        scroll = ScrollView()
+        self.jobs_box = MDBoxLayout(orientation='vertical', spacing=dp(8), size_hint_y=None)
+        self.jobs_box.bind(minimum_height=self.jobs_box.setter('height'))
+        scroll.add_widget(self.jobs_box)
+        layout.add_widget(card); layout.add_widget(scroll)
         self.add_widget(layout)
 
     def refresh_texts(self):
@@ -412,40 +2733,64 @@ class DownloadScreen(MDScreen):
         self.url_input.hint_text = tr('enter_url')
         self.paste_btn.text = tr('paste')
         self.download_btn.text = tr('download')
-        self.progress_label.text = tr('ready')
+        for row in self._job_rows.values(): row.update()
 
     def _paste(self, inst):
         try:
+            try: from plyer import clipboard
+            except Exception: clipboard = None
             if clipboard:
                 txt = clipboard.paste()
                 if txt: self.url_input.text = txt
             else: show_message(tr('could_not_play'))
         except Exception as e: show_message(str(e))
 
-    @mainthread
-    def _update_progress(self, percent, downloaded, total):
-        self.progress_card.opacity = 1
-        self.progress_bar.value = percent
-        self.progress_label.text = tr('downloading') if percent < 100 else tr('download_complete')
-        self.progress_details.text = f"{percent:.1f}% • {human_size(downloaded)}/{human_size(total)}"
+    def _update_jobs(self, jobs):
+        # called once per UI frame by progress_aggregator with every job that changed
+        for job in jobs:
+            row = self._job_rows.get(job.id)
+            if row is None:
+                if job.state in ('done', 'error', 'cancelled'): continue
+                row = JobRow(job); self._job_rows[job.id] = row
+                self.jobs_box.add_widget(row)
+            row.update()
+            if job.state in ('done', 'error', 'cancelled'):
+                Clock.schedule_once(lambda dt, job_id=job.id: self._remove_row(job_id), 2 if job.state == 'done' else 3)
+
+    def _remove_row(self, job_id):
+        row = self._job_rows.pop(job_id, None)
+        if row is not None: self.jobs_box.remove_widget(row)
 
     @mainthread
     def _done(self, entry):
-        self.download_btn.disabled = False; self.url_input.text=''
-        Clock.schedule_once(lambda dt: setattr(self.progress_card, 'opacity', 0), 2)
-        show_message(tr('downloaded', title=entry.get('title', TRANSLATIONS['video'][LANG])), duration=2)
+        key = 'already_downloaded' if entry.get('duplicate') else 'downloaded'
+        show_message(tr(key, title=entry.get('title', TRANSLATIONS['video'][LANG])), duration=2)
 
     @mainthread
     def _err(self, msg):
-        self.download_btn.disabled = False; show_message(str(msg))
-        Clock.schedule_once(lambda dt: setattr(self.progress_card, 'opacity', 0), 3)
+        show_message(str(msg))
+
+    def resume_unfinished(self):
+        records = download_journal.unfinished()
+        if records:
+            download_manager.restore(records, listener=self._update_jobs, complete_callback=self._done, error_callback=self._err)
+
+    def _toggle_batch(self, inst):
+        self._batch_mode = not self._batch_mode
+        self.batch_btn.icon = 'playlist-check' if self._batch_mode else 'playlist-plus'
 
     def _start(self, inst):
-        url = self.url_input.text.strip()
-        if not url:
+        text = self.url_input.text.strip()
+        if not text:
             show_message(tr('enter_url')); return
-        self.download_btn.disabled = True; self.progress_card.opacity = 1
-        VideoDownloader.download_video(url, progress_callback=self._update_progress, complete_callback=self._done, error_callback=self._err)
+        self.url_input.text = ''
+        callbacks = dict(listener=self._update_jobs, complete_callback=self._done, error_callback=self._err)
+        urls = BatchIngestor.split_urls(text)
+        if self._batch_mode or len(urls) > 1:
+            count = batch_ingestor.ingest(text, **callbacks)
+            show_message(tr('batch_started', count=count), duration=1.5)
+        else:
+            download_manager.submit(text, **callbacks)
 
 class VideosScreen(MDScreen):
     def __init__(self, **kwargs):
@@ -456,47 +2801,137 @@ class VideosScreen(MDScreen):
         header.add_widget(self.header_label)
         header.add_widget(MDIconButton(icon='refresh', on_release=lambda *a: self._refresh()))
         root.add_widget(header)
-        scroll = ScrollView()
-        self.list_box = MDBoxLayout(orientation='vertical', spacing=dp(8), size_hint_y=None)
-        self.list_box.bind(minimum_height=self.list_box.setter('height'))
-        scroll.add_widget(self.list_box)
-        root.add_widget(scroll)
+        # search / sort / platform filter served by search_index
+        self._sort = 'date'; self._descending = True; self._platform = None
+        self._view_trigger = Clock.create_trigger(lambda dt: self._apply_view(), 0.15)
+        tools = MDBoxLayout(orientation='horizontal', size_hint_y=None, height=dp(48), spacing=dp(4))
+        self.search_input = MDTextField(hint_text=tr('search'), multiline=False)
+        self.search_input.bind(text=lambda *a: self._view_trigger())
+        self.sort_btn = MDFlatButton(text=tr('sort_by', field=tr('sort_date')), on_release=self._cycle_sort)
+        self.order_btn = MDIconButton(icon='sort-descending', on_release=self._toggle_order)
+        self.platform_btn = MDFlatButton(text=tr('all_platforms'), on_release=self._cycle_platform)
+        tools.add_widget(self.search_input); tools.add_widget(self.sort_btn)
+        tools.add_widget(self.order_btn); tools.add_widget(self.platform_btn)
+        root.add_widget(tools)
+        # virtualized: only the visible VideoCards exist, rv.data holds one small dict per entry
+        self.body = MDBoxLayout(orientation='vertical')
+        self.rv = RecycleView(viewclass=VideoCard)
+        self.list_layout = RecycleBoxLayout(orientation='vertical', spacing=dp(8), size_hint_y=None,
+                                            default_size=(None, dp(120)), default_size_hint=(1, None))
+        self.list_layout.bind(minimum_height=self.list_layout.setter('height'))
+        self.rv.add_widget(self.list_layout)
+        self.body.add_widget(self.rv)
+        root.add_widget(self.body)
         self.add_widget(root)
-        self._refresh()
+        self._empty_card = None
+        library.subscribe(self._on_library_event)
+        # until then the list fills from the 'reset' sent by library.preload()
+        if library.loaded: self._rebuild()
 
     def refresh_texts(self):
         self.header_label.text = tr('library')
-        self._refresh()
+        self.search_input.hint_text = tr('search')
+        self.sort_btn.text = tr('sort_by', field=tr('sort_' + self._sort))
+        self._update_platform_btn()
+        self.rv.refresh_from_data()
+        if self._empty_card is not None: self._empty_label.text = tr('no_videos')
 
     def _refresh(self, *a):
-        global video_database
-        video_database = load_db()
-        self.list_box.clear_widgets()
-        if not video_database:
-            c = MDCard(radius=[12], padding=dp(16), size_hint_y=None, height=dp(140))
-            c.add_widget(MDLabel(text=tr('no_videos'), halign='center'))
-            self.list_box.add_widget(c)
+        # re-read the store, then re-check it against the folder (full rescan when asked by hand)
+        library.reload()
+        library_reconciler.run_async(force=True, on_done=self._reconciled)
+
+    def _reconciled(self, report):
+        if report['missing'] or report['untracked'] or report['orphans']:
+            show_message(tr('reconcile_report', **report), duration=2)
+
+    def _row(self, v):
+        return {'video_info': v, 'on_play': self._play, 'on_delete': self._delete, 'on_pin': self._toggle_pin}
+
+    def _row_index(self, path):
+        for i, row in enumerate(self.rv.data):
+            if row['video_info'].get('path') == path: return i
+        return None
+
+    def _set_empty(self, empty):
+        if empty and self._empty_card is None:
+            self._empty_card = MDCard(radius=[12], padding=dp(16), size_hint_y=None, height=dp(140))
+            self._empty_label = MDLabel(text=tr('no_videos'), halign='center')
+            self._empty_card.add_widget(self._empty_label)
+            self.body.add_widget(self._empty_card, index=len(self.body.children))
+        elif not empty and self._empty_card is not None:
+            self.body.remove_widget(self._empty_card); self._empty_card = None
+
+    def _rebuild(self):
+        self._populate(list(reversed(library.entries())))
+
+    def _populate(self, entries):
+        self._set_empty(not entries)
+        self.rv.data = [self._row(v) for v in entries]
+
+    def _is_default_view(self):
+        return not self.search_input.text.strip() and self._platform is None and self._sort == 'date' and self._descending
+
+    def _apply_view(self):
+        if self._is_default_view():
+            self._rebuild()
+        else:
+            self._populate(search_index.query(self.search_input.text, platform=self._platform,
+                                              sort=self._sort, descending=self._descending))
+
+    def _cycle_sort(self, inst):
+        keys = list(LibrarySearchIndex.SORT_KEYS)
+        self._sort = keys[(keys.index(self._sort) + 1) % len(keys)]
+        self.sort_btn.text = tr('sort_by', field=tr('sort_' + self._sort))
+        self._apply_view()
+
+    def _toggle_order(self, inst):
+        self._descending = not self._descending
+        self.order_btn.icon = 'sort-descending' if self._descending else 'sort-ascending'
+        self._apply_view()
+
+    def _update_platform_btn(self):
+        if self._platform is None:
+            self.platform_btn.text = tr('all_platforms')
         else:
-            for v in reversed(video_database):
-                card = VideoCard(v, on_play=self._play, on_delete=self._delete)
-                card.size_hint_y = None
-                card.height = dp(120)
-                self.list_box.add_widget(card)
+            count = search_index.platform_stats().get(self._platform, {}).get('count', 0)
+            self.platform_btn.text = f'{self._platform} ({count})'
+
+    def _cycle_platform(self, inst):
+        names = [None] + sorted(search_index.platform_stats())
+        self._platform = names[(names.index(self._platform) + 1) % len(names)] if self._platform in names else None
+        self._update_platform_btn()
+        self._apply_view()
+
+    def _on_library_event(self, event, entry):
+        if event == 'reset' or (event in ('add', 'remove') and not self._is_default_view()):
+            # filtered/sorted views are re-queried; the default view is patched in place
+            self._view_trigger(); return
+        if event == 'add':
+            self._set_empty(False)
+            # newest first
+            self.rv.data.insert(0, self._row(entry))
+            return
+        index = self._row_index(entry.get('path'))
+        if index is None: return
+        if event == 'remove':
+            del self.rv.data[index]
+            if not self.rv.data: self._set_empty(True)
+        elif event == 'update':
+            self.rv.data[index] = self._row(entry)
 
     def _play(self, video_info):
         app = MDApp.get_running_app()
         app.player_screen.load_video(video_info)
-        app.screen_manager.current = 'player'
+        app.switch('player')
+
+    def _toggle_pin(self, video_info):
+        library.update(video_info, pinned=not video_info.get('pinned'))
 
     def _delete(self, video_info):
         def confirm(*a):
-            global video_database
-            video_database = [x for x in video_database if x.get('path') != video_info.get('path')]
-            save_db(video_database)
-            try:
-                if os.path.exists(video_info.get('path')): os.remove(video_info.get('path'))
-            except Exception as e: show_message(str(e))
-            self._refresh(); dialog.dismiss()
+            deletion_worker.delete([video_info])
+            dialog.dismiss()
         def cancel(*a): dialog.dismiss()
         dialog = MDDialog(title=tr('confirm_delete_title'),
                           text=tr('confirm_delete_text', title=video_info.get('title', TRANSLATIONS['video'][LANG])),
@@ -504,6 +2939,59 @@ class VideosScreen(MDScreen):
                                    MDRaisedButton(text=tr('confirm'), on_release=confirm)])
         dialog.open()
 
+class SeekModeCache:
+    """
+    How Video.seek() behaves ('seconds', 'fraction' or 'position') per Kivy video provider
+    and container, persisted in seek_modes.json. PlayerScreen probes a combination once and
+    afterwards seeks with a single call; a seek that lands wrong drops the entry again.
+    """
+    MODES = ('seconds', 'fraction', 'position')
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._modes = None
+
+    @staticmethod
+    def key(source):
+        try:
+            from kivy.core.video import Video as CoreVideo
+            provider = CoreVideo.__name__ if CoreVideo else 'none'
+        except Exception:
+            provider = 'none'
+        ext = os.path.splitext(source or '')[1].lower().lstrip('.') or 'unknown'
+        return f'{provider}:{ext}'
+
+    def _load(self):
+        if self._modes is None:
+            try: self._modes = json.loads(self.path.read_text(encoding='utf-8'))
+            except Exception: self._modes = {}
+        return self._modes
+
+    def _save(self):
+        try:
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            tmp.write_text(json.dumps(self._modes), encoding='utf-8')
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print('Error saving seek modes:', e)
+
+    def get(self, key):
+        with self._lock:
+            mode = self._load().get(key)
+        return mode if mode in self.MODES else None
+
+    def put(self, key, mode):
+        with self._lock:
+            if mode not in self.MODES or self._load().get(key) == mode: return
+            self._modes[key] = mode; self._save()
+
+    def forget(self, key):
+        with self._lock:
+            if self._load().pop(key, None) is not None: self._save()
+
+seek_mode_cache = SeekModeCache(SEEK_MODES_FILE)
+
 class PlayerScreen(MDScreen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs); self.name='player'
@@ -518,8 +3006,11 @@ class PlayerScreen(MDScreen):
         top.add_widget(self.title_label)
         root.add_widget(top)
 
-        self.video_widget = Video(state='stop', options={'allow_stretch': True}, size_hint_y=0.7)
-        root.add_widget(self.video_widget)
+        # the Video widget is created on load_video and dropped again after sitting idle off-screen
+        self.video_widget = None
+        self._video_slot = MDBoxLayout(size_hint_y=0.7)
+        root.add_widget(self._video_slot)
+        self._release_ev = None
 
         controls = MDBoxLayout(orientation='horizontal', size_hint_y=None, height=dp(48), spacing=dp(8))
         self.play_btn = MDRaisedButton(text=tr('play'), on_release=self.toggle_play)
@@ -556,7 +3047,13 @@ class PlayerScreen(MDScreen):
         self.tooltip_card.opacity = 0
         self.container.add_widget(self.tooltip_card)
 
-        self._event = None
+        # status labels follow the Video's properties, coalesced to one update per frame;
+        # position is only observed while playing on screen with the app in the foreground
+        self._status_trigger = Clock.create_trigger(self._update_status, 0)
+        self._status_bound = False
+        self._visible = False
+        self._app_paused = False
+        self._shown_secs = None
         self._was_playing = False
         self._seeking = False
 
@@ -564,10 +3061,9 @@ class PlayerScreen(MDScreen):
         self._preview_scheduled = None
         self._preview_pos_seconds = None
 
-        # NEW: detected seek mode: 'seconds', 'fraction', or None
+        # seek semantics of the current provider/container: 'seconds', 'fraction', 'position' or None
         self._seek_mode = None
-        # track last known duration to re-run detection if duration changes
-        self._last_duration = 0.0
+        self._seek_key = None
 
     def refresh_texts(self):
         try:
@@ -590,26 +3086,96 @@ class PlayerScreen(MDScreen):
 
         title_text = info.get('title','')
         self.title_label.text = ar(title_text) if LANG == 'ar' else title_text
+        # recency for the storage limit's least-recently-played eviction
+        entry = library.get(path)
+        if entry is not None: library.update(entry, last_played=datetime.now().isoformat())
 
         try:
+            self._ensure_video()
             self.video_widget.source = path
             self.video_widget.state = 'play'
+            # protected from eviction until playback stops or the widget is released
+            storage_quota.playing = path
             self.play_btn.text = tr('pause')
-            if self._event: Clock.unschedule(self._event)
-            self._event = Clock.schedule_interval(self._update_status, 0.5)
-            # schedule seek-mode detection a bit after playback starts
-            Clock.schedule_once(lambda dt: self._maybe_detect_seek_mode(), 0.6)
+            self._shown_secs = None
+            self._sync_status_binding()
+            self._seek_key = seek_mode_cache.key(path)
+            self._seek_mode = seek_mode_cache.get(self._seek_key)
+            if self._seek_mode is None:
+                # unknown provider/container: probe once a bit after playback starts
+                Clock.schedule_once(lambda dt: self._maybe_detect_seek_mode(), 0.6)
         except Exception:
             if not self._open_external(path): show_message(tr('could_not_play'))
 
+    def _ensure_video(self):
+        if self.video_widget is None:
+            self.video_widget = Video(state='stop', options={'allow_stretch': True}, volume=self.volume_slider.value)
+            self.video_widget.bind(duration=self._on_video_tick, state=self._on_video_state)
+            self._video_slot.add_widget(self.video_widget)
+        return self.video_widget
+
+    def _on_video_tick(self, *a):
+        self._status_trigger()
+
+    def _on_video_state(self, vw, state):
+        if state == 'stop' and storage_quota.playing == vw.source: storage_quota.playing = None
+        self._sync_status_binding()
+        self._status_trigger()
+
+    def _sync_status_binding(self):
+        vw = self.video_widget
+        want = vw is not None and vw.state == 'play' and self._visible and not self._app_paused
+        if want == self._status_bound: return
+        if want:
+            vw.bind(position=self._on_video_tick); self._status_trigger()
+        else:
+            if vw is not None: vw.unbind(position=self._on_video_tick)
+            self._status_trigger.cancel()
+        self._status_bound = want
+
+    def set_app_paused(self, paused):
+        self._app_paused = paused
+        self._sync_status_binding()
+
+    def on_enter(self, *a):
+        self._visible = True
+        self._shown_secs = None
+        self._sync_status_binding()
+        if self._release_ev is not None:
+            self._release_ev.cancel(); self._release_ev = None
+
+    def on_leave(self, *a):
+        self._visible = False
+        self._sync_status_binding()
+        if self.video_widget is None: return
+        if self._release_ev is not None: self._release_ev.cancel()
+        self._release_ev = Clock.schedule_once(self._release_video, config.get('player_idle_release', 60))
+
+    def _release_video(self, dt=None):
+        """Unload the decoder and drop the Video widget (and its textures) once idle off-screen."""
+        self._release_ev = None
+        vw = self.video_widget
+        if vw is None or (self.manager is not None and self.manager.current == self.name): return
+        if vw.state == 'play':
+            # still playing in the background; look again later
+            self._release_ev = Clock.schedule_once(self._release_video, config.get('player_idle_release', 60))
+            return
+        self._sync_status_binding()
+        vw.unbind(duration=self._on_video_tick, state=self._on_video_state)
+        try: vw.unload()
+        except Exception: pass
+        self._video_slot.remove_widget(vw)
+        self.video_widget = None
+        storage_quota.playing = None
+        self.play_btn.text = tr('play')
+
     def _maybe_detect_seek_mode(self):
-        # run detection only if duration known and changed
+        # run detection only once the duration is known and no seek has taught us the mode yet
         try:
             dur = float(self.video_widget.duration) if self.video_widget.duration else 0.0
         except Exception:
             dur = 0.0
-        if dur and abs(dur - self._last_duration) > 0.5:
-            self._last_duration = dur
+        if dur and self._seek_mode is None:
             self._detect_seek_mode()
 
     def _detect_seek_mode(self):
@@ -660,6 +3226,7 @@ class PlayerScreen(MDScreen):
                     except Exception: pass
             # set mode
             self._seek_mode = verified['mode']
+            if self._seek_mode: seek_mode_cache.put(self._seek_key, self._seek_mode)
             print(f"[DEBUG] seek mode set to: {self._seek_mode}")
 
         # attempt test seek safely
@@ -684,14 +3251,21 @@ class PlayerScreen(MDScreen):
                     self.progress_slider.max = dur
                 if not self._seeking:
                     self.progress_slider.value = pos
-                self.time_label.text = self._format_time(pos)
-                self.duration_label.text = self._format_time(dur)
+                self._show_time(pos, dur)
             else:
                 if not self._seeking:
                     self.progress_slider.value = min(1.0, pos) if pos else self.progress_slider.value
         except Exception:
             pass
 
+    def _show_time(self, pos, dur):
+        # labels only change when a whole second does
+        secs = (int(pos), int(dur))
+        if secs == self._shown_secs: return
+        self._shown_secs = secs
+        self.time_label.text = self._format_time(pos)
+        self.duration_label.text = self._format_time(dur)
+
     def _format_time(self, s):
         try:
             s = int(float(s))
@@ -839,22 +3413,31 @@ class PlayerScreen(MDScreen):
 
         if dur and target_seconds is not None:
             target_seconds = max(0.0, min(target_seconds, dur))
+            # position is not observed while paused, so show the target right away
+            self._show_time(target_seconds, dur)
+            if self.progress_slider.max > 1.001: self.progress_slider.value = target_seconds
 
-        # Choose order according to detected seek-mode
-        attempts = []
-        if self._seek_mode == 'seconds':
-            attempts = [('seek_seconds', lambda t: self._try_seek_seconds(t)),
-                        ('set_position', lambda t: self._try_set_position(t)),
-                        ('seek_fraction', lambda t: self._try_seek_fraction(t, dur))]
-        elif self._seek_mode == 'fraction':
-            attempts = [('seek_fraction', lambda t: self._try_seek_fraction(t, dur)),
-                        ('set_position', lambda t: self._try_set_position(t)),
-                        ('seek_seconds', lambda t: self._try_seek_seconds(t))]
-        else:
-            # unknown: try safe sequence (fraction first since calling seconds with big value may jump to end)
-            attempts = [('seek_fraction', lambda t: self._try_seek_fraction(t, dur)),
-                        ('seek_seconds', lambda t: self._try_seek_seconds(t)),
-                        ('set_position', lambda t: self._try_set_position(t))]
+        if self._seek_mode:
+            # known semantics: one call, no verification round-trip before playback resumes
+            try:
+                self._seek_call(self._seek_mode, target_seconds, dur)
+            except Exception as e:
+                print(f"[DEBUG] {self._seek_mode} seek raised: {e}")
+                self._unlearn_seek_mode()
+            else:
+                self._seeking = False
+                if self._was_playing:
+                    self.video_widget.state = 'play'; self.play_btn.text = tr('pause')
+                else:
+                    self.video_widget.state = 'pause'; self.play_btn.text = tr('play')
+                source = self.video_widget.source
+                Clock.schedule_once(lambda dt: self._check_seek(source, target_seconds, dur), 0.3)
+                return
+
+        # unknown: try safe sequence (fraction first since calling seconds with big value may jump to end)
+        attempts = [('fraction', lambda t: self._try_seek_fraction(t, dur)),
+                    ('seconds', lambda t: self._try_seek_seconds(t)),
+                    ('position', lambda t: self._try_set_position(t))]
 
         state = {'index': 0, 'target': target_seconds, 'dur': dur, 'attempts': attempts}
         self._seeking = True
@@ -890,6 +3473,8 @@ class PlayerScreen(MDScreen):
             print(f"[DEBUG] verify: pos={pos:.2f}, target={target:.2f}, diff={diff:.2f}, tol={tol:.2f}")
             if diff <= tol:
                 print(f"[DEBUG] Seek verified successful (pos ~ target). Using method index {state['index']-1}")
+                self._seek_mode = state['attempts'][state['index'] - 1][0]
+                seek_mode_cache.put(self._seek_key, self._seek_mode)
                 self._seeking = False
                 if self._was_playing:
                     self.video_widget.state = 'play'; self.play_btn.text = tr('pause')
@@ -902,6 +3487,25 @@ class PlayerScreen(MDScreen):
 
         try_next()
 
+    def _seek_call(self, mode, seconds, dur):
+        if mode == 'seconds': self._try_seek_seconds(seconds)
+        elif mode == 'fraction': self._try_seek_fraction(seconds, dur)
+        else: self._try_set_position(seconds)
+
+    def _check_seek(self, source, target, dur):
+        # after-the-fact check of a single-shot seek; a miss sends the next seek through the probe chain
+        if self._seeking or self.video_widget is None or self.video_widget.source != source: return
+        try: pos = float(self.video_widget.position or 0.0)
+        except Exception: return
+        if abs(pos - target) > max(1.0, 0.02 * (dur or 60)) + 0.5:
+            print(f"[DEBUG] {self._seek_mode} seek landed at {pos:.2f} instead of {target:.2f}; re-probing")
+            self._unlearn_seek_mode()
+            self._perform_verified_seek(target)
+
+    def _unlearn_seek_mode(self):
+        self._seek_mode = None
+        seek_mode_cache.forget(self._seek_key)
+
     # low-level attempts
     def _try_seek_seconds(self, seconds):
         try:
@@ -963,13 +3567,10 @@ class PlayerScreen(MDScreen):
             return False
 
     def _back(self):
-        try:
-            if self._event: Clock.unschedule(self._event)
-        except Exception:
-            pass
         try: self.video_widget.state = 'stop'
         except Exception: pass
-        MDApp.get_running_app().screen_manager.current = 'videos'
+        storage_quota.playing = None
+        MDApp.get_running_app().switch('videos')
 
 class SettingsScreen(MDScreen):
     def __init__(self, **kwargs):
@@ -983,49 +3584,77 @@ class SettingsScreen(MDScreen):
         lang_btn_text = tr('language_button_en') if LANG == 'ar' else tr('language_button_ar')
         self.lang_btn = MDRaisedButton(text=lang_btn_text, on_release=self._toggle_language)
         layout.add_widget(self.lang_btn)
+        self.quality_btn = MDRaisedButton(text=tr('format_profile', name=format_selector.profile_name()), on_release=self._cycle_profile)
+        layout.add_widget(self.quality_btn)
+        self.quota_btn = MDRaisedButton(text=self._quota_text(), on_release=self._cycle_quota)
+        layout.add_widget(self.quota_btn)
         self.storage_label = MDLabel(text=tr('files_info', count=0, size='0 KB'), font_style='Caption')
         layout.add_widget(self.storage_label)
+        self.breakdown_label = MDLabel(text='', font_style='Caption')
+        layout.add_widget(self.breakdown_label)
         self.add_widget(layout)
-        self.storage_label.text = tr('files_info', count=self._storage_count(), size=human_size(self._storage_size()))
+        # totals come from storage_accountant; nothing here walks the video folder
+        storage_accountant.subscribe(self._show_storage)
+        self._show_storage(storage_accountant.totals())
 
     def refresh_texts(self):
         try:
             self.clear_btn.text = tr('clear_all_videos')
             self.open_folder_btn.text = tr('open_video_folder')
             self.lang_btn.text = tr('language_button_en') if LANG == 'ar' else tr('language_button_ar')
-            self.storage_label.text = tr('files_info', count=self._storage_count(), size=human_size(self._storage_size()))
+            self.quality_btn.text = tr('format_profile', name=format_selector.profile_name())
+            self.quota_btn.text = self._quota_text()
+            self._show_storage(storage_accountant.totals())
         except Exception:
             pass
 
-    def _storage_count(self):
-        total=0; count=0
-        for f in VIDEO_DIR.glob('*'):
-            if f.is_file(): total += f.stat().st_size; count +=1
-        return count
-
-    def _storage_size(self):
-        total=0
-        for f in VIDEO_DIR.glob('*'):
-            if f.is_file(): total += f.stat().st_size
-        return total
-
-    def _storage_text(self):
-        total=self._storage_size(); count=self._storage_count()
-        return tr('files_info', count=count, size=human_size(total))
+    def _show_storage(self, totals):
+        videos = totals['videos']
+        self.storage_label.text = tr('files_info', count=videos['count'], size=human_size(videos['size']))
+        self.breakdown_label.text = tr('storage_breakdown', videos=human_size(videos['size']),
+                                       thumbs=human_size(totals['thumbs']['size']),
+                                       partials=human_size(totals['partials']['size']))
 
     def _clear_all(self, inst):
         def confirm(*a):
-            for f in VIDEO_DIR.glob('*'):
-                try: f.unlink()
-                except: pass
-            global video_database
-            video_database=[]; save_db(video_database)
-            show_message(tr('download_complete')); dialog.dismiss()
+            dialog.dismiss()
+            self._start_clear()
         def cancel(*a): dialog.dismiss()
         dialog = MDDialog(title=tr('confirm_clear_title'), text=tr('confirm_clear_text'),
                           buttons=[MDFlatButton(text=tr('cancel'), on_release=cancel), MDRaisedButton(text=tr('confirm'), on_release=confirm)])
         dialog.open()
 
+    def _start_clear(self):
+        progress = MDDialog(title=tr('deleting', done=0, total=len(library.entries())),
+                            buttons=[MDFlatButton(text=tr('cancel'), on_release=lambda *a: task.cancel())])
+        def on_progress(t):
+            progress.title = tr('deleting', done=t.done, total=t.total)
+        def on_done(t):
+            progress.dismiss()
+            show_message(tr('deleted_count', count=t.done))
+        task = deletion_worker.clear_all(on_progress=on_progress, on_done=on_done)
+        progress.open()
+
+    def _cycle_profile(self, inst):
+        names = list(format_selector.profiles())
+        cur = format_selector.profile_name()
+        config['format_profile'] = names[(names.index(cur) + 1) % len(names)]
+        save_config(config)
+        self.quality_btn.text = tr('format_profile', name=config['format_profile'])
+
+    QUOTA_STEPS_MB = (0, 1024, 2048, 5120, 10240, 20480)
+
+    def _quota_text(self):
+        mb = storage_quota.limit() // 1024**2
+        return tr('storage_quota', size=f'{mb / 1024:g} GB' if mb else tr('unlimited'))
+
+    def _cycle_quota(self, inst):
+        cur = storage_quota.limit() // 1024**2
+        steps = self.QUOTA_STEPS_MB
+        config['storage_quota_mb'] = steps[(steps.index(cur) + 1) % len(steps)] if cur in steps else 0
+        save_config(config)
+        self.quota_btn.text = self._quota_text()
+
     def _open_folder(self, inst):
         try:
             if platform == 'win': os.startfile(str(VIDEO_DIR))
@@ -1048,13 +3677,18 @@ class SettingsScreen(MDScreen):
 class HeFedMobileApp(MDApp):
     def build(self):
         if platform in ('linux','win','macosx'): Window.size=(380,760)
+        with startup_profiler.phase('fonts'): register_fonts()
+        with startup_profiler.phase('dirs'): ensure_dirs()
+        with startup_profiler.phase('build'): return self._build_root()
+
+    def _build_root(self):
         root = MDBoxLayout(orientation='vertical')
         self.top_bar = MDTopAppBar(title=tr('app_title'), elevation=4)
         root.add_widget(self.top_bar)
         self.screen_manager = MDScreenManager()
-        self.download_screen = DownloadScreen(); self.videos_screen = VideosScreen(); self.player_screen = PlayerScreen(); self.settings_screen = SettingsScreen()
-        self.screen_manager.add_widget(self.download_screen); self.screen_manager.add_widget(self.videos_screen)
-        self.screen_manager.add_widget(self.player_screen); self.screen_manager.add_widget(self.settings_screen)
+        # only the first screen is built here; the rest on first switch()
+        self._screens = {}
+        self.screen('download')
         root.add_widget(self.screen_manager)
         bottom = MDBoxLayout(size_hint_y=None, height=dp(72), padding=dp(8))
         box = MDBoxLayout(orientation='horizontal', spacing=dp(8))
@@ -1065,34 +3699,210 @@ class HeFedMobileApp(MDApp):
         self.screen_manager.current = 'download'
         return root
 
+    SCREENS = {'download': DownloadScreen, 'videos': VideosScreen, 'player': PlayerScreen, 'settings': SettingsScreen}
+
+    def screen(self, name):
+        """The named screen, constructed and added to the manager on first use."""
+        scr = self._screens.get(name)
+        if scr is None:
+            with startup_profiler.phase('screen_' + name):
+                scr = self._screens[name] = self.SCREENS[name]()
+                self.screen_manager.add_widget(scr)
+        return scr
+
+    download_screen = property(lambda self: self.screen('download'))
+    videos_screen = property(lambda self: self.screen('videos'))
+    player_screen = property(lambda self: self.screen('player'))
+    settings_screen = property(lambda self: self.screen('settings'))
+
     def refresh_language(self):
         try:
             self.top_bar.title = tr('app_title')
         except Exception:
             pass
-        try: self.download_screen.refresh_texts()
-        except Exception: pass
-        try: self.videos_screen.refresh_texts()
-        except Exception: pass
-        try: self.player_screen.refresh_texts()
-        except Exception: pass
-        try: self.settings_screen.refresh_texts()
-        except Exception: pass
+        # screens not built yet pick the language up when they are
+        for scr in list(self._screens.values()):
+            try: scr.refresh_texts()
+            except Exception: pass
 
     def switch(self, name):
-        if name=='download':
-            self.screen_manager.current='download'
-        elif name=='videos':
-            self.videos_screen._refresh()
-            self.screen_manager.current='videos'
-        elif name=='settings':
-            self.settings_screen.storage_label.text = tr('files_info', count=self.settings_screen._storage_count(), size=human_size(self.settings_screen._storage_size()))
-            self.screen_manager.current='settings'
+        self.screen(name)
+        if name=='settings':
+            # labels already show the running totals; re-count quietly if they are stale
+            storage_accountant.reconcile_async(max_age=60)
+        self.screen_manager.current = name
+
+    def on_pause(self):
+        # nothing on screen while in the background: stop following playback position
+        player = self._screens.get('player')
+        if player is not None: player.set_app_paused(True)
+        return True
+
+    def on_resume(self):
+        player = self._screens.get('player')
+        if player is not None: player.set_app_paused(False)
 
     def on_start(self):
         Clock.schedule_once(lambda dt: show_message(tr('welcome'), duration=1.8), 0.6)
+        # continue downloads interrupted by a crash or kill from their partial files
+        try: self.download_screen.resume_unfinished()
+        except Exception: traceback.print_exc()
+        # give library videos without a thumbnail one made from a local frame
+        Clock.schedule_once(lambda dt: local_thumbnailer.scan_library(), 3)
+        # the frame after on_start is the first one drawn; heavy work waits for it
+        Clock.schedule_once(self._after_first_frame, 0)
+
+    def _after_first_frame(self, dt):
+        startup_profiler.mark('first_frame')
+        threading.Thread(target=self._warm_up, daemon=True).start()
+
+    def _warm_up(self):
+        with startup_profiler.phase('library'):
+            library.preload()
+        with startup_profiler.phase('reconcile'):
+            try: library_reconciler.reconcile()
+            except Exception: traceback.print_exc()
+        with startup_profiler.phase('yt_dlp'):
+            if load_yt_dlp() is not None:
+                try:
+                    from yt_dlp.extractor import gen_extractor_classes
+                    gen_extractor_classes()
+                except Exception: pass
+        startup_profiler.mark('warm')
+        startup_profiler.report()
+        storage_accountant.reconcile_async()
+
+class SeekBenchmark(MDApp):
+    """
+    Seek latency on locally generated clips: python hefed.py -- --bench-seek
+    ffmpeg renders a short test pattern per container, each clip is opened in a PlayerScreen
+    and every target is timed from the seek call until the position settles near it, first
+    through the probe chain (mode forgotten before each seek) and then single-shot with the
+    learned mode. Results are printed and saved to APP_DIR/seek_bench.json.
+    """
+    CLIPS = {'mp4': ['-c:v', 'mpeg4', '-q:v', '5'], 'mkv': ['-c:v', 'mpeg4', '-q:v', '5'],
+             'webm': ['-c:v', 'libvpx', '-b:v', '400k']}
+    DURATION = 20
+    TARGETS = (5.0, 15.0, 2.0, 12.0, 8.0)
+    TIMEOUT = 5.0
+
+    def make_clips(self, folder):
+        import shutil, subprocess
+        ffmpeg = shutil.which('ffmpeg')
+        if not ffmpeg:
+            print('ffmpeg not found; cannot generate test clips'); return {}
+        clips = {}
+        for ext, codec in self.CLIPS.items():
+            dest = os.path.join(folder, 'seek_test.' + ext)
+            cmd = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'lavfi',
+                   '-i', f'testsrc=duration={self.DURATION}:size=320x240:rate=25', *codec, '-g', '50', dest]
+            try:
+                if subprocess.run(cmd, timeout=120).returncode == 0: clips[ext] = dest
+            except Exception as e:
+                print('Could not generate', ext, 'clip:', e)
+        return clips
+
+    def build(self):
+        import tempfile
+        self._folder = tempfile.mkdtemp(prefix='hefed_seek_')
+        self.results = {}
+        sm = MDScreenManager()
+        self.player = PlayerScreen(); sm.add_widget(self.player)
+        self._steps = self._run(self.make_clips(self._folder))
+        self._ev = Clock.schedule_interval(self._tick, 0)
+        return sm
+
+    def _tick(self, dt):
+        try:
+            next(self._steps)
+        except StopIteration:
+            self._ev.cancel(); self._report(); self.stop()
+
+    def _wait(self, seconds):
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end: yield
+
+    def _run(self, clips):
+        p = self.player
+        for ext, path in clips.items():
+            p.load_video({'path': path, 'title': ext})
+            end = time.perf_counter() + 10
+            while not (p.video_widget.duration or 0) > 0 and time.perf_counter() < end: yield
+            if not (p.video_widget.duration or 0) > 0:
+                print(ext, ': clip did not open'); continue
+            yield from self._wait(1.0)  # let the load-time probe finish
+            dur = float(p.video_widget.duration)
+            tol = max(1.0, 0.02 * dur) + 0.5
+            for label in ('probe', 'cached'):
+                times = []
+                for target in self.TARGETS:
+                    if label == 'probe': p._unlearn_seek_mode()
+                    elif not p._seek_mode: break
+                    p._was_playing = True
+                    t0 = time.perf_counter()
+                    p._perform_verified_seek(target)
+                    while True:
+                        yield
+                        elapsed = time.perf_counter() - t0
+                        if not p._seeking and abs(float(p.video_widget.position or 0) - target) <= tol:
+                            times.append(elapsed); break
+                        if elapsed > self.TIMEOUT:
+                            times.append(None); break
+                    yield from self._wait(0.3)
+                self.results.setdefault(ext, {})[label] = {'mode': p._seek_mode, 'seconds': times}
+            p.video_widget.state = 'stop'
+
+    def _report(self):
+        print('Seek latency (provider %s):' % SeekModeCache.key('x').split(':')[0])
+        for ext, passes in self.results.items():
+            for label, r in passes.items():
+                ok = sorted(t for t in r['seconds'] if t is not None)
+                misses = len(r['seconds']) - len(ok)
+                median = ok[len(ok) // 2] * 1000 if ok else float('nan')
+                worst = ok[-1] * 1000 if ok else float('nan')
+                print(f'  {ext:<5} {label:<7} mode={r["mode"]!s:<9} median {median:7.1f} ms  max {worst:7.1f} ms  misses {misses}')
+        try:
+            (APP_DIR / 'seek_bench.json').write_text(json.dumps(self.results, indent=1), encoding='utf-8')
+        except Exception as e:
+            print('Error saving seek benchmark:', e)
+
+    def on_stop(self):
+        import shutil
+        shutil.rmtree(getattr(self, '_folder', ''), ignore_errors=True)
+
+def _check_search_remove():
+    # a removed entry must vanish from substring results without breaking the rank lookup
+    class Model:
+        def __init__(self, entries): self._entries = entries
+        def entries(self): return list(self._entries)
+        def subscribe(self, listener): pass
+    entries = [{'path': f'/v/{i}.mp4', 'title': 'Holiday trip' if i == 0 else f'Clip {i}',
+                'download_date': f'2024-01-{i + 1:02d}'} for i in range(21)]
+    index = LibrarySearchIndex(Model(entries))
+    assert [e['path'] for e in index.query('holiday')] == ['/v/0.mp4']
+    index._on_event('remove', entries[0])
+    assert index.query('holiday') == []
+    assert len(index.query('clip')) == 20
+
+SELF_CHECKS = [_check_search_remove]
+
+def self_check():
+    """Quick in-process regression checks: python hefed.py -- --self-check"""
+    failed = 0
+    for check in SELF_CHECKS:
+        try:
+            check(); print('ok  ', check.__name__)
+        except Exception:
+            failed += 1; print('FAIL', check.__name__); traceback.print_exc()
+    return failed
+
+startup_profiler.record('imports', time.perf_counter() - _T0)
 
 def main():
+    if '--bench-seek' in sys.argv:
+        SeekBenchmark().run(); return
+    if '--self-check' in sys.argv:
+        sys.exit(1 if self_check() else 0)
     try:
         HeFedMobileApp().run()
     except Exception as e: